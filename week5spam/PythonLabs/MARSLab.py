@@ -3,13 +3,14 @@
 # __all__ = [ ]
 
 from math import sqrt
-from copy import copy
-from random import randint
+from array import array
+from random import Random, randint, getrandbits
+from concurrent.futures import ProcessPoolExecutor
 import re
 import os
 import PythonLabs
 from .Canvas import Canvas
-from .Tools import classname, path_to_data
+from .Tools import classname, path_to_data, enum
 
 ## Error types for this module
 
@@ -27,12 +28,13 @@ class PC:
     instruction fetch cycle.
     """
     
-    def __init__(self, tag, addr, memsize, hmax = 10):
+    def __init__(self, tag, addr, memsize, hmax = 10, maxthreads = None):
         """
         [MARSLab] Create a new program counter.  The tag argument is a string that can be 
         used to identify which program is running at this location.  The PC is intialized 
         with one thread starting at location addr.  The hmax argument is the number of 
-        items to save in the history array (used in visualization).
+        items to save in the history array (used in visualization).  If maxthreads is 
+        not None it is the maximum number of threads.
         """
         self._tag = tag
         self._addrs = [addr]
@@ -43,6 +45,7 @@ class PC:
         self._current = {'thread' : None, 'addr' : None}
         self._first = addr
         self._hmax = hmax
+        self._maxthreads = maxthreads
         
     def __repr__(self):
         # s = "<" + classname(self) + " "
@@ -96,9 +99,11 @@ class PC:
         
     def add_thread(self, addr):
         """
-        [MARSLab] Add a new thread, which will begin execution at location addr.
+        [MARSLab] Add a new thread, which will begin execution at location addr (unless
+        the PC already has the maximum number of threads).
         """
-        self._addrs.append(addr)
+        if self._maxthreads is None or len(self._addrs) < self._maxthreads:
+            self._addrs.append(addr)
         # self._history.append([])
         # self
         
@@ -134,21 +139,30 @@ class Memory:
     in a Memory are Word objects.
 
     According to the Corewar standard, memory should be initialized with DAT #0 instructions
-    before each contest.  For efficiency, newly (re)initialized Memory objects have None
-    at each location, but  is treated the same as DAT #0.
+    before each contest.  A Memory does not actually hold Word objects:  the opcode, modes,
+    and values of the words are kept in five parallel sequences of integers, so reading and
+    writing a field is just an index operation.  The opcodes and modes are arrays of small
+    integers; the operand values are lists, since ADD and SUB do not reduce their results
+    and a value can grow past any fixed size.  The fetch method makes a new Word object
+    with a copy of the contents of a location.  A sixth array records which locations
+    have been written since the memory was created or cleared (see CMP).
     """
     
     def __init__(self, size):
         """
         [MARSLab] Create a new memory with the specified number of words. According to the 
         Corewar standard, memory should be initialized with DAT #0 instructions before each 
-        contest.  For efficiency, newly (re)initialized Memory objects have None at each 
-        location, but None is converted to DAT #0 by the fetch method.
+        contest.
         """
-        self._array = [None] * size
+        self._op = array('q', [Opcode.DAT]) * size
+        self._amode = array('q', [Mode.IMMEDIATE]) * size
+        self._a = [0] * size
+        self._bmode = array('q', [Mode.IMMEDIATE]) * size
+        self._b = [0] * size
+        self._used = bytearray(size)
         
     def __repr__(self):
-        return "<%s [0..%d]>" % (classname(self), len(self._array)-1)
+        return "<%s [0..%d]>" % (classname(self), len(self._op)-1)
         
     def dump(self, loc, n):
         "[MARSLab] # Print the n words in memory starting at loc."
@@ -156,119 +170,222 @@ class Memory:
         
     def size(self):
         "[MARSLab] Return the size of this Memory object (number of words that can be stored)."
-        return len(self._array)
+        return len(self._op)
+        
+    def clear(self):
+        "[MARSLab] Store DAT #0 #0 in every location in this memory."
+        n = len(self._op)
+        self._op[:] = array('q', [Opcode.DAT]) * n
+        self._amode[:] = array('q', [Mode.IMMEDIATE]) * n
+        self._a[:] = [0] * n
+        self._bmode[:] = array('q', [Mode.IMMEDIATE]) * n
+        self._b[:] = [0] * n
+        self._used[:] = bytearray(n)
         
     def fetch(self, loc):
-        "[MARSLab] Return the Word object stored in location loc in this Memory object."
-        if self._array[loc]:
-            return self._array[loc]
-        else:
-            return Word('DAT', '#0', '#0')
+        """
+        [MARSLab] Return a Word object with the contents of location loc in this Memory 
+        object (changing the Word does not change the memory -- call store to do that).
+        """
+        return Word._from_fields(self._op[loc], self._amode[loc], self._a[loc], self._bmode[loc], self._b[loc])
             
     def store(self, loc, val):
         "[MARSLab] Store val (a Word object) in location loc in this memory."
-        self._array[loc] = copy(val)
+        self._op[loc] = val._op
+        self._amode[loc] = val._amode
+        self._a[loc] = val._a
+        self._bmode[loc] = val._bmode
+        self._b[loc] = val._b
+        self._used[loc] = 1
+        
+    def move(self, src, dest):
+        "[MARSLab] Copy the word in location src to location dest."
+        self._op[dest] = self._op[src]
+        self._amode[dest] = self._amode[src]
+        self._a[dest] = self._a[src]
+        self._bmode[dest] = self._bmode[src]
+        self._b[dest] = self._b[src]
+        self._used[dest] = 1
         
     def fetch_field(self, loc, field):
         """
-        [MARSLab] Same as fetch, but return only the designated field of the Word stored 
-        at location loc.
+        [MARSLab] Same as fetch, but return only the designated field (the value of
+        the A or B operand) of the Word stored at location loc.
         """
-        word = self.fetch(loc)
-        return word._a if field == 'a' else word._b
+        return self._a[loc] if field == 'a' else self._b[loc]
         
     def store_field(self, loc, val, field):
         """
         [MARSLab] Same as store, but overwrite only the designated field of the Word in 
         location loc, preserving the same addressing mode as the original.
         """
-        word = self.fetch(loc)
-        part = word._a if field == 'a' else word._b
-        mode = part[0] if re.match(r'[@<#]', part) else ''
         if field == 'a':
-            word._a = mode + str(val)
+            self._a[loc] = val
         else:
-            word._b = mode + str(val)
-        self.store(loc, word)
+            self._b[loc] = val
+        self._used[loc] = 1
 
 
 ## Word 
 
 # An object of the Word class represents a single item from memory, either a machine 
-# instruction or a piece of data.  Attributes are the opcode, the A operand mode, and 
-# the B operand (all strings).  Instruction execution proceeds according to the description 
-# in Durham's spec.
+# instruction or a piece of data.  Attributes are the opcode, the addressing mode and
+# value of the A operand, and the addressing mode and value of the B operand.  The 
+# assembler decodes operands once, so the opcode and modes are small integers (see the
+# Opcode and Mode enums) and the values are ints; strings like '@-3' are only made when
+# a Word is printed.  Instruction execution proceeds according to the description in
+# Durham's spec.
+
+Opcode = enum('Opcode', 'DAT', 'MOV', 'ADD', 'SUB', 'JMP', 'JMZ', 'JMN', 'DJN', 'CMP', 'SLT', 'SPL')
+Mode = enum('Mode', 'DIRECT', 'IMMEDIATE', 'INDIRECT', 'DECREMENT')
+
+_opnames = ('DAT', 'MOV', 'ADD', 'SUB', 'JMP', 'JMZ', 'JMN', 'DJN', 'CMP', 'SLT', 'SPL')
+_mode_chars = ('', '#', '@', '<')
 
 class Word:
-    """docstring for Word"""
+    """
+    [MARSLab] A Word is a Redcode instruction (or data) stored in one memory location.
+    """
+    
+    __slots__ = ('_op', '_amode', '_a', '_bmode', '_b', '_lineno', '_func')
     
     def __init__(self, op = 'DAT', a = '#0', b = '#0', lineno = None):
+        """
+        Make a Word from an opcode name and two operand strings, e.g. Word('MOV', '0', '1').
+        Operands can have an addressing mode character (#, @, or <) followed by an integer.
+        """
         if op in Word._optable:
-            self._op = op
-            self._a = a
-            self._b = b
+            self._op = _opnames.index(op)
+            self._amode, self._a = Word.decode(a)
+            self._bmode, self._b = Word.decode(b)
             self._lineno = lineno
             self._func = Word._optable[op]
         else:
             raise MARSError("Unknown opcode: " + str(op))
+            
+    # Make a Word from an opcode and modes that are already decoded (used by the assembler
+    # and when copying words).
+    
+    @staticmethod
+    def _from_fields(op, amode, a, bmode, b, lineno = None):
+        word = Word.__new__(Word)
+        word._op = op
+        word._amode = amode
+        word._a = a
+        word._bmode = bmode
+        word._b = b
+        word._lineno = lineno
+        word._func = Word._functions[op]
+        return word
 
     def __repr__(self):
-        return "%s %s %s" % (self._op, self._a, self._b)
+        return "%s %s%d %s%d" % (_opnames[self._op], _mode_chars[self._amode], self._a, _mode_chars[self._bmode], self._b)
+        
+    # Two words are equal if they have the same opcode and operands (the line number 
+    # is ignored), and equal words have the same hash.
+    
+    def __eq__(self, other):
+        if not isinstance(other, Word):
+            return NotImplemented
+        return (self._op, self._amode, self._a, self._bmode, self._b) == (other._op, other._amode, other._a, other._bmode, other._b)
+        
+    def __hash__(self):
+        return hash((self._op, self._amode, self._a, self._bmode, self._b))
+        
+    def __copy__(self):
+        return Word._from_fields(self._op, self._amode, self._a, self._bmode, self._b, self._lineno)
         
     @staticmethod
-    def field_value(field):
-        if re.match(r'[@<#]', field):
-            return int(field[1:])
+    def decode(field):
+        """
+        [MARSLab] Split an operand string into an addressing mode (one of the values 
+        in Mode) and an integer value, e.g. '@-3' becomes (Mode.INDIRECT, -3).  An empty
+        operand is the same as '#0', which is what the assembler uses for missing operands.
+        """
+        if len(field) == 0:
+            return Mode.IMMEDIATE, 0
+        if field[0] in _mode_chars[1:]:
+            mode, value = _mode_chars.index(field[0]), field[1:]
         else:
-            return int(field)
+            mode, value = Mode.DIRECT, field
+        if not re.match(r'[+-]?\d+$', value):
+            raise MARSError("operand must be an integer, optionally preceded by #, @, or <: %s" % field)
+        return mode, int(value)
+    
+    @staticmethod
+    def field_value(field):
+        "[MARSLab] Return the integer part of an operand string, e.g. 3 for '@3'."
+        return Word.decode(field)[1]
     
     @staticmethod
     def dereference(field, pc, mem):
         """
         [MARSLab] Return the address of an operand; note that for immediate operands 
-        the address is the address of the current instruction.
+        the address is the address of the current instruction.  The operand is a string
+        with an optional mode character, e.g. '@-3'.
         """
-        if field[0] == '#':
+        mode, value = Word.decode(field)
+        return Word._dereference(mode, value, pc, mem)
+        
+    # Same as dereference, but for an operand that has already been decoded into a mode
+    # and an integer value (this is the version instructions use).
+    
+    @staticmethod
+    def _dereference(mode, value, pc, mem):
+        if mode == Mode.IMMEDIATE:
           return pc._current['addr']
-        elif field[0] == '@':
-          ptrloc = (Word.field_value(field) + pc._current['addr']) % mem.size()
-          ptr = mem.fetch(ptrloc)
-          return (Word.field_value(ptr._b) + ptrloc) % mem.size()
-        elif field[0] == '<':
-          ptrloc = (Word.field_value(field) + pc._current['addr']) % mem.size()
-          ptr = mem.fetch(ptrloc)
-          newb = Word.field_value(ptr._b) - 1
+        elif mode == Mode.INDIRECT:
+          ptrloc = (value + pc._current['addr']) % mem.size()
+          return (mem.fetch_field(ptrloc, 'b') + ptrloc) % mem.size()
+        elif mode == Mode.DECREMENT:
+          ptrloc = (value + pc._current['addr']) % mem.size()
+          newb = mem.fetch_field(ptrloc, 'b') - 1
           mem.store_field(ptrloc, (newb % mem.size()), 'b')
           return (newb + ptrloc) % mem.size()
         else:
-          return (Word.field_value(field) + pc._current['addr']) % mem.size()
-        end
+          return (value + pc._current['addr']) % mem.size()
+
+    # Memory used to hold Word objects, and the instruction being executed was the object
+    # in memory.  If the A operand auto-decrements the instruction's own location (as in
+    # "DJN <0, x") the B operand sees the new value, so instructions that use both operands
+    # dereference A with this method.
+    
+    def _dereference_a(self, pc, mem):
+        addr = Word._dereference(self._amode, self._a, pc, mem)
+        if self._amode == Mode.DECREMENT and self._a % mem.size() == 0:
+            self._b = mem.fetch_field(pc._current['addr'], 'b')
+        return addr
 
     def execute(self, pc, mem):
         self._func(self, pc, mem)
-        return 'halt' if self._op == 'DAT' else 'continue'
+        return 'halt' if self._op == Opcode.DAT else 'continue'
         
     # The DAT instruction is effectively a "halt", but we still need to dereference
     # both its operands to generate the side effects in auto-decrement modes.
 
     def DAT(self, pc, mem):
-        Word.dereference(self._a, pc, mem)
-        Word.dereference(self._b, pc, mem)
+        self._dereference_a(pc, mem)
+        Word._dereference(self._bmode, self._b, pc, mem)
 
     # Durham isn't clear on how to handle immediate moves -- does the immediate value
     # go in the A or B field of the destination?  Guess:  B, in case the destination
     # is a DAT.
+    # MOV, ADD, and SUB used to fetch the A operand before dereferencing B.  The fetch
+    # returned the word in memory, so an auto-decrement through B was seen by the A operand,
+    # except at an untouched location, where fetch made a new DAT #0 word.
 
     def MOV(self, pc, mem):
-        if self._b[0] == '#':
+        if self._bmode == Mode.IMMEDIATE:
             raise MARSRuntimeException("MOV: immediate B-field not allowed")
-        src = Word.dereference(self._a, pc, mem)
-        val = mem.fetch(src)
-        dest = Word.dereference(self._b, pc, mem)
-        if self._a[0] == '#':
-            mem.store_field(dest, Word.field_value(val._a), 'b')
+        src = self._dereference_a(pc, mem)
+        untouched = not mem._used[src]
+        dest = Word._dereference(self._bmode, self._b, pc, mem)
+        if self._amode == Mode.IMMEDIATE:
+            mem.store_field(dest, mem.fetch_field(src, 'a'), 'b')
+        elif untouched:
+            mem.store(dest, Word())
         else:
-            mem.store(dest, val)
+            mem.move(src, dest)
         # pc.log(src)
         pc.log(dest)
 
@@ -276,34 +393,34 @@ class Word:
     # field of the destination?  Guess:  B (for same reasons given for MOV)
 
     def ADD(self, pc, mem):
-        if self._b[0] == '#':
+        if self._bmode == Mode.IMMEDIATE:
             raise MARSRuntimeException("ADD: immediate B-field not allowed")
-        src = Word.dereference(self._a, pc, mem)
-        left_operand = mem.fetch(src)
-        dest = Word.dereference(self._b, pc, mem)
-        right_operand = mem.fetch(dest)
-        if self._a[0] == '#':
-            mem.store_field(dest, Word.field_value(left_operand._a) + Word.field_value(right_operand._b), 'b')
+        src = self._dereference_a(pc, mem)
+        untouched = not mem._used[src]
+        dest = Word._dereference(self._bmode, self._b, pc, mem)
+        if self._amode == Mode.IMMEDIATE:
+            mem.store_field(dest, mem.fetch_field(src, 'a') + mem.fetch_field(dest, 'b'), 'b')
         else:
-            mem.store_field(dest, Word.field_value(left_operand._a) + Word.field_value(right_operand._a), 'a')
-            mem.store_field(dest, Word.field_value(left_operand._b) + Word.field_value(right_operand._b), 'b')
+            srcb = 0 if untouched else mem.fetch_field(src, 'b')
+            mem.store_field(dest, mem.fetch_field(src, 'a') + mem.fetch_field(dest, 'a'), 'a')
+            mem.store_field(dest, srcb + mem.fetch_field(dest, 'b'), 'b')
             # pc.log(src)
         pc.log(dest)
 
     # See note for ADD, re immediate A operand.
 
     def SUB(self, pc, mem):
-        if self._b[0] == '#':
+        if self._bmode == Mode.IMMEDIATE:
             raise MARSRuntimeException("SUB: immediate B-field not allowed")
-        src = Word.dereference(self._a, pc, mem)
-        right_operand = mem.fetch(src)
-        dest = Word.dereference(self._b, pc, mem)
-        left_operand = mem.fetch(dest)
-        if self._a[0] == '#':
-            mem.store_field(dest, Word.field_value(left_operand._b) - Word.field_value(right_operand._a), 'b')
+        src = self._dereference_a(pc, mem)
+        untouched = not mem._used[src]
+        dest = Word._dereference(self._bmode, self._b, pc, mem)
+        if self._amode == Mode.IMMEDIATE:
+            mem.store_field(dest, mem.fetch_field(dest, 'b') - mem.fetch_field(src, 'a'), 'b')
         else:
-            mem.store_field(dest, Word.field_value(left_operand._a) - Word.field_value(right_operand._a), 'a')
-            mem.store_field(dest, Word.field_value(left_operand._b) - Word.field_value(right_operand._b), 'b')
+            srcb = 0 if untouched else mem.fetch_field(src, 'b')
+            mem.store_field(dest, mem.fetch_field(dest, 'a') - mem.fetch_field(src, 'a'), 'a')
+            mem.store_field(dest, mem.fetch_field(dest, 'b') - srcb, 'b')
             # pc.log(src)
         pc.log(dest)
 
@@ -311,42 +428,39 @@ class Word:
     # we have to dereference it in case it has a side effect.
 
     def JMP(self, pc, mem):
-        if self._a[0] == '#':
+        if self._amode == Mode.IMMEDIATE:
             raise MARSRuntimeException("JMP: immediate A-field not allowed")
-        target = Word.dereference(self._a, pc, mem) % mem.size()
-        Word.dereference(self._b, pc, mem)
+        target = self._dereference_a(pc, mem) % mem.size()
+        Word._dereference(self._bmode, self._b, pc, mem)
         pc.branch(target)
 
     # Branch to address specified by A if the B-field of the B operand is zero.
 
     def JMZ(self, pc, mem):
-        if self._a[0] == '#':
+        if self._amode == Mode.IMMEDIATE:
             raise MARSRuntimeException("JMZ: immediate A-field not allowed")
-        target = Word.dereference(self._a, pc, mem) % mem.size()
-        operand = mem.fetch(Word.dereference(self._b, pc, mem))
-        if Word.field_value(operand._b) == 0:
+        target = self._dereference_a(pc, mem) % mem.size()
+        if mem.fetch_field(Word._dereference(self._bmode, self._b, pc, mem), 'b') == 0:
             pc.branch(target)
 
     # As in JMZ, but branch if operand is non-zero
 
     def JMN(self, pc, mem):
-        if self._a[0] == '#':
+        if self._amode == Mode.IMMEDIATE:
             raise MARSRuntimeException("JMZ: immediate A-field not allowed")
-        target = Word.dereference(self._a, pc, mem) % mem.size()
-        operand = mem.fetch(Word.dereference(self._b, pc, mem))
-        if Word.field_value(operand._b) != 0:
+        target = self._dereference_a(pc, mem) % mem.size()
+        if mem.fetch_field(Word._dereference(self._bmode, self._b, pc, mem), 'b') != 0:
             pc.branch(target)
 
     # DJN combines the auto-decrement mode dereference logic with a branch -- take
     # the branch if the new value of the B field of the pointer is non-zero.
 
     def DJN(self, pc, mem):
-        if self._a[0] == '#':
+        if self._amode == Mode.IMMEDIATE:
             raise MARSRuntimeException("JMZ: immediate A-field not allowed")
-        target = Word.dereference(self._a, pc, mem) % mem.size()
-        operand_addr = Word.dereference(self._b, pc, mem)
-        operand = mem.fetch(operand_addr)
-        newb = Word.field_value(operand._b) - 1
+        target = self._dereference_a(pc, mem) % mem.size()
+        operand_addr = Word._dereference(self._bmode, self._b, pc, mem)
+        newb = mem.fetch_field(operand_addr, 'b') - 1
         mem.store_field(operand_addr, (newb % mem.size()), 'b')
         if newb != 0:
             pc.branch(target)
@@ -358,16 +472,24 @@ class Word:
     # If A is not immediate compare two full Words -- including op codes.  
     # The call to pc.increment increments the program counter for this thread, which causes 
     # the skip.
+    # Full words are compared the way they were when memory held Word objects and CMP
+    # tested object identity:  the operands match only if they are the same location,
+    # that location has been written (an untouched location was a new DAT #0 word on
+    # every fetch), and the auto-decrement of the A operand did not write to it (a
+    # write stored a new object).
 
     def CMP(self, pc, mem):
-        if self._b[0] == '#':
+        if self._bmode == Mode.IMMEDIATE:
             raise MARSRuntimeException("SUB: immediate B-field not allowed")
-        right = mem.fetch(Word.dereference(self._b, pc, mem))
-        if self._a[0] == '#':
-            left = Word.field_value(self._a)
-            right = Word.field_value(right._a)
+        right = Word._dereference(self._bmode, self._b, pc, mem)
+        if self._amode == Mode.IMMEDIATE:
+            left = self._a
+            right = mem.fetch_field(right, 'a')
         else:
-            left = mem.fetch(Word.dereference(self._a, pc, mem))
+            same = mem._used[right] and not (self._amode == Mode.DECREMENT and (self._a + pc._current['addr']) % mem.size() == right)
+            left = Word._dereference(self._amode, self._a, pc, mem)
+            if not same:
+                return
         if left == right:
             pc.increment()
 
@@ -378,13 +500,13 @@ class Word:
     # modes and just comparing values.
 
     def SLT(self, pc, mem):
-        if self._b[0] == '#':
+        if self._bmode == Mode.IMMEDIATE:
             raise MARSRuntimeException("SUB: immediate B-field not allowed")
-        if self._a[0] == '#':
-            left = Word.field_value(self._a)
+        if self._amode == Mode.IMMEDIATE:
+            left = self._a
         else:
-            left = Word.field_value(mem.fetch(Word.dereference(self._a, pc, mem))._b)
-        right = Word.field_value(mem.fetch(Word.dereference(self._b, pc, mem))._b)
+            left = mem.fetch_field(self._dereference_a(pc, mem), 'b')
+        right = mem.fetch_field(Word._dereference(self._bmode, self._b, pc, mem), 'b')
         if left < right: 
             pc.increment()
 
@@ -393,9 +515,9 @@ class Word:
     # implies only A is dereferenced, so ignore B.
 
     def SPL(self, pc, mem):
-        if self._a[0] == '#':
+        if self._amode == Mode.IMMEDIATE:
             raise MARSRuntimeException("JMZ: immediate A-field not allowed")
-        target = Word.dereference(self._a, pc, mem)
+        target = Word._dereference(self._amode, self._a, pc, mem)
         pc.add_thread(target)
         
     _optable = {
@@ -411,6 +533,26 @@ class Word:
         'SLT' : SLT,
         'SPL' : SPL,
     }
+    
+    _functions = [DAT, MOV, ADD, SUB, JMP, JMZ, JMN, DJN, CMP, SLT, SPL]      # indexed by Opcode values
+
+# Operand checks and address calculation used by the headless interpreter in MARS.run
+
+_no_immediate_a = (Opcode.JMP, Opcode.JMZ, Opcode.JMN, Opcode.DJN, Opcode.SPL)
+_no_immediate_b = (Opcode.MOV, Opcode.ADD, Opcode.SUB, Opcode.CMP, Opcode.SLT)
+
+def _resolve(mode, value, ip, bval, used, size):
+    if mode == Mode.IMMEDIATE:
+        return ip
+    p = (value + ip) % size
+    if mode == Mode.DIRECT:
+        return p
+    x = bval[p]
+    if mode == Mode.DECREMENT:
+        x -= 1
+        bval[p] = x % size
+        used[p] = 1
+    return (x + p) % size
 
 ## Warrior class
 
@@ -451,14 +593,15 @@ class Warrior:
 
 # This class defines a singleton object.  Attributes are the system memory, an
 # array of PC objects (one per competing program), and descriptions of the competing
-# programs.  
+# programs; these all belong to a default Core object (MARS.core).
 
 # Static methods are used to assemble, load, and execute programs.  Functions that have
 # names starting with underscores are helpers, not intended to be called directly by
 # users.
 
-# Note: memory size and memory layout is fixed at compile time.  Attributes are defined
-# as symbolic names but they should not be modified...
+# Note: the size of the default core and the memory layout on the canvas are fixed at 
+# compile time.  Attributes are defined as symbolic names but they should not be modified
+# (make a Core object to use a different size)...
 
 _cell_rows = 32
 _cell_cols = 128
@@ -488,12 +631,360 @@ class MARSView:
         self.palettes = palettes
         self.options = options
 
+## Cores
+
+# A Core object is a complete MARS machine:  a memory, a PC for each program loaded
+# into the memory, and a list of the memory segments used so far.  The MARS class
+# (below) uses a single default Core, and it is the only one that can be displayed 
+# on the canvas.  Other cores can have different sizes and limits, and can be used to
+# run battles in separate threads or processes.
+
+class Core:
+    """
+    [MARSLab] A Core is a MARS virtual machine with its own memory and programs.
+    """
+    
+    def __init__(self, size = _memsize, max_cycles = None, max_processes = None):
+        """
+        [MARSLab] Make a new core with the specified number of memory cells.  If max_cycles 
+        is not None it is the default number of steps for the run method.  If max_processes 
+        is not None it is the largest number of threads a program can have (an SPL 
+        instruction does not make a new thread when a program already has this many).
+        """
+        if type(size) != int or size < 1:
+            raise MARSError("core size must be a positive integer")
+        self._size = size
+        self._max_cycles = max_cycles
+        self._max_processes = max_processes
+        self.memory = Memory(size)      # opcodes and operands of the words in the core
+        self.pcs = [ ]                  # one PC (program counter) per active program
+        self.entries = [ ]              # one Warrior project for each program loaded
+        self.mem_used = [ ]             # set of memory segments used by loaded programs
+        
+    def __repr__(self):
+        return "<%s size: %d programs: %d>" % (classname(self), self._size, len(self.entries))
+        
+    def size(self):
+        "[MARSLab] Return the number of memory cells in this core."
+        return self._size
+        
+    # The display shows the default core used by the MARS class
+    
+    def _on_canvas(self):
+        return Canvas.view is not None and self is MARS.core
+        
+    def check_loc(self, lb, ub):
+        """
+        [MARSLab] See if the range of addresses between lb and ub overlap any of the
+        memory segments currently in use.
+        """
+        for (i, j) in self.mem_used:
+            if not (ub < i or lb > j):  return False
+        return True
+        
+    def use_loc(self, addr, n):
+        """
+        [MARSLab] Reserve memory locations for a program of size n being loaded into
+        addr.  The runtime parameter named 'buffer' is an amount to reserve on either
+        size of the program, e.g. if 'buffer' is 10 and the request is to load a 5-word
+        program into location 100 reserve locations 90 to 115. If the request extends
+        past the end of memory add two segments to the mem_used list, one at the end
+        of memory and one for the wraparound.
+        """
+        buf = MARS_runtime_options['buffer']
+        lb = addr - buf
+        ub = addr + n + buf - 1
+        if lb < 0:
+            self.mem_used.append( (0, ub) )
+            self.mem_used.append( (self._size + lb, self._size - 1) )
+        elif ub >= self._size:
+            self.mem_used.append( (lb, self._size - 1) )
+            self.mem_used.append( (0, ub - self._size) )
+        else:
+            self.mem_used.append( (lb, ub) )
+        
+        
+    def load(self, prog, addr = None):
+        """
+        [MARSLab] Load a program (either a list of Redcode instructions, the name of a 
+        text file, or a Warrior made by assembling a program) into this core.  If no 
+        address is specified the program is loaded into a random address sufficiently 
+        far from any other program currently in memory.
+        """
+        slot = len(self.entries)
+        
+        if slot == _maxentries:
+            print("Maximum number of entries (%d) already loaded" % _maxentries)
+            return None
+        
+        w = prog if isinstance(prog, Warrior) else Warrior(prog)
+        
+        if len(w._code) > self._size // 4:
+            print("Exceeds maximum program size (%d); code not loaded" % (self._size // 4))
+            return None
+        
+        if addr is not None:
+#             if not self.check_loc(addr, addr + len(w._code)):
+#                 print("Too close to another program; choose a different address")
+#                 return None
+            pass
+        else:
+            while True:
+                addr = randint(0, self._size-1)
+                if self.check_loc(addr, addr + len(w._code)):  break
+        
+        w._start = addr
+        addrlist = []
+        self.use_loc(addr, len(w._code))
+        for (i, instr) in enumerate(w._code):
+            self.memory.store((addr+i) % self._size, instr)
+            addrlist.append((addr+i) % self._size)
+        
+        self.entries.append(w)
+        self.pcs.append( PC(w._name, (addr+w._symbols[':start']) % self._size, self._size, maxthreads = self._max_processes) )
+        if self._on_canvas():
+            MARS.update_cells(addrlist, slot)
+        
+        return w
+        
+    def alive(self, i):
+        """
+        [MARSLab] Return True if program i is still alive.
+        """
+        if i < len(self.entries):
+            if len(self.pcs[i]._addrs) > 0:
+                return True
+        return False
+        
+    def num_alive(self):
+        """
+        [MARSLab] Return the number of programs that are still alive.
+        """
+        n = 0
+        for pc in self.pcs:
+            if len(pc._addrs) > 0:  n += 1
+        return n
+        
+    def status(self):
+        """
+        [MARSLab] Print information about programs loaded into memory.
+        """
+        if len(self.entries) == 0:
+            print("No programs loaded")
+        for (i, w) in enumerate(self.entries):
+            print("%-10s: %4d..%-4d  PC: %s" % (w._name, w._start, w._start+len(w._code)-1, str(self.pcs[i])))
+    
+    def step(self):
+        """
+        [MARSLab] Execute one instruction from each program.  Each program has its
+        own PC object.  A PC manages threads internally -- a call to pc.increment
+        gets the address of the next instruction in the current thread switches to
+        the next thread.  The call to increment returns None if there are no surviving
+        threads.
+        """
+        if len(self.entries) == 0:
+            print("No programs loaded")
+            return 0
+        view = self._on_canvas()
+                
+        for (i, pc) in enumerate(self.pcs):
+            addr = pc.increment()
+            if addr != None:
+                instr = self.memory.fetch(addr)
+                # print(i, addr, ":", instr)
+                try:
+                    state = instr.execute(pc, self.memory)
+                except MARSRuntimeException as e:
+                    print("Program %s at address %d: %s" % (self.entries[i]._name, addr, e.args[0]))
+                    state = 'halt'
+                if state == 'halt':
+                    pc.kill_thread()
+                    if view:
+                        MARS.blacken_cell(addr)
+                elif view:
+                    MARS.update_cells(pc._history, i)
+        if view:
+            Canvas.update()
+
+    def run(self, nsteps = None, single = False):
+        """
+        [MARSLab] Run all programs for the specified number of steps (if the argument
+        is None the number of steps is the max_cycles value this core was made with,
+        or, if that is None, the runtime option named maxRounds).  In the
+        default mode (single = False) execution stops early if the number of surviving 
+        programs drops to 1, i.e. one program has won the war.  To continue running
+        a single program (e.g. for debugging) set single to True.
+        """
+        if nsteps == None:
+            nsteps = self._max_cycles or MARS_runtime_options['maxRounds']
+        minsurvivors = 1 if single else 2
+        if not self._on_canvas():
+            nsteps = self._run_headless(nsteps, minsurvivors)
+        while nsteps > 0 and self.num_alive() >= minsurvivors:
+            self.step()
+            nsteps -= 1
+        if nsteps > 0:
+            return "halted"
+
+    # The interpreter used by run when there is no display.  It has the same effect
+    # on memory and program counters as calling step nsteps times, but it works
+    # directly on the memory arrays:  operand addresses are computed inline, the
+    # instruction is selected by comparing integer opcodes, and the number of programs 
+    # still alive is updated only when a thread dies.  PC histories (used only to draw
+    # the display) are not recorded.  The return value is the number of steps that were
+    # not executed because fewer than minsurvivors programs were still alive.
+    
+    def _run_headless(self, nsteps, minsurvivors):
+        mem = self.memory
+        op, amode, aval, bmode, bval, used = mem._op, mem._amode, mem._a, mem._bmode, mem._b, mem._used
+        size = len(op)
+        pcs = list(enumerate(self.pcs))
+        alive = self.num_alive()
+        DIRECT, IMMEDIATE, DECREMENT = Mode.DIRECT, Mode.IMMEDIATE, Mode.DECREMENT
+        DAT, MOV, ADD, SUB, JMP, JMZ, JMN, DJN, CMP, SLT, SPL = [getattr(Opcode, name) for name in _opnames]
+        while nsteps > 0 and alive >= minsurvivors:
+            for (i, pc) in pcs:
+                addrs = pc._addrs
+                if not addrs:  continue
+                t = pc._thread                          # fetch, as in PC.increment
+                ip = addrs[t]
+                addrs[t] = (ip + 1) % size
+                pc._thread = (t + 1) % len(addrs)
+                o = op[ip]
+                am = amode[ip]
+                av = aval[ip]
+                bm = bmode[ip]
+                bv = bval[ip]
+                halt = False
+                
+                if (am == IMMEDIATE and o in _no_immediate_a) or (bm == IMMEDIATE and o in _no_immediate_b):
+                    try:                                # let the Word method raise the exception
+                        Word._functions[o](Word._from_fields(o, am, av, bm, bv), pc, mem)
+                    except MARSRuntimeException as e:
+                        print("Program %s at address %d: %s" % (self.entries[i]._name, ip, e.args[0]))
+                    halt = True
+                    
+                elif o == CMP:                   # CMP dereferences B before A
+                    pb = _resolve(bm, bv, ip, bval, used, size)
+                    if am == IMMEDIATE:
+                        skip = av == aval[pb]
+                    else:                               # as in Word.CMP
+                        skip = used[pb] and not (am == DECREMENT and (av + ip) % size == pb)
+                        pa = _resolve(am, av, ip, bval, used, size)
+                        skip = skip and pa == pb
+                    if skip:
+                        t2 = pc._thread
+                        addrs[t2] = (addrs[t2] + 1) % size
+                        pc._thread = (t2 + 1) % len(addrs)
+                    
+                else:
+                    if am == DIRECT:               # address of the A operand
+                        pa = (av + ip) % size
+                    elif am == IMMEDIATE:
+                        pa = ip
+                    else:
+                        p = (av + ip) % size
+                        x = bval[p]
+                        if am == DECREMENT:
+                            x -= 1
+                            bval[p] = x % size
+                            used[p] = 1
+                            if p == ip:         # as in Word._dereference_a
+                                bv = bval[p]
+                        pa = (x + p) % size
+                    srcb = None                  # B field of A, if dereferencing B changes it
+                    if o != SPL:                 # address of the B operand (SPL ignores B)
+                        if bm == DIRECT:
+                            pb = (bv + ip) % size
+                        elif bm == IMMEDIATE:
+                            pb = ip
+                        else:
+                            p = (bv + ip) % size
+                            x = bval[p]
+                            if bm == DECREMENT:
+                                if p == pa and (o == SLT or not used[p]):
+                                    srcb = x     # SLT reads A first; see also Word.MOV
+                                x -= 1
+                                bval[p] = x % size
+                                used[p] = 1
+                            pb = (x + p) % size
+                        
+                    if o == MOV:
+                        if am == IMMEDIATE:
+                            bval[pb] = aval[pa]
+                        else:
+                            op[pb] = op[pa]
+                            amode[pb] = amode[pa]
+                            aval[pb] = aval[pa]
+                            bmode[pb] = bmode[pa]
+                            bval[pb] = bval[pa] if srcb is None else srcb
+                        used[pb] = 1
+                    elif o == ADD:
+                        if am == IMMEDIATE:
+                            bval[pb] = aval[pa] + bval[pb]
+                        else:
+                            aval[pb] = aval[pa] + aval[pb]
+                            bval[pb] = (bval[pa] if srcb is None else srcb) + bval[pb]
+                        used[pb] = 1
+                    elif o == SUB:
+                        if am == IMMEDIATE:
+                            bval[pb] = bval[pb] - aval[pa]
+                        else:
+                            aval[pb] = aval[pb] - aval[pa]
+                            bval[pb] = bval[pb] - (bval[pa] if srcb is None else srcb)
+                        used[pb] = 1
+                    elif o == JMP:
+                        addrs[t] = pa
+                    elif o == JMZ:
+                        if bval[pb] == 0:
+                            addrs[t] = pa
+                    elif o == JMN:
+                        if bval[pb] != 0:
+                            addrs[t] = pa
+                    elif o == DJN:
+                        x = bval[pb] - 1
+                        bval[pb] = x % size
+                        used[pb] = 1
+                        if x != 0:
+                            addrs[t] = pa
+                    elif o == SPL:
+                        if pc._maxthreads is None or len(addrs) < pc._maxthreads:
+                            addrs.append(pa)
+                    elif o == SLT:
+                        left = av if am == IMMEDIATE else (bval[pa] if srcb is None else srcb)
+                        if left < bval[pb]:
+                            t2 = pc._thread
+                            addrs[t2] = (addrs[t2] + 1) % size
+                            pc._thread = (t2 + 1) % len(addrs)
+                    else:                               # DAT
+                        halt = True
+                        
+                if halt:                                # as in PC.kill_thread
+                    addrs.pop(t)
+                    pc._thread -= 1
+                    if not addrs:
+                        alive -= 1
+            nsteps -= 1
+        return nsteps
+
+    def reset(self):
+        """
+        [MARSLab] Clear all the programs from memory.
+        """
+        self.memory.clear()
+        del self.pcs[:]
+        del self.entries[:]
+        del self.mem_used[:]
+        if self._on_canvas():
+            MARS.view(**Canvas.view.options)
+
 class MARS:
     
-    memory = Memory(_memsize)           # an array of Word objects
-    pcs = [ ]                           # one PC (program counter) per active program
-    entries = [ ]                       # one Warrior project for each program loaded
-    mem_used = [ ]                      # set of memory segments used by loaded programs
+    core = Core()                       # the default core, shown on the canvas
+    memory = core.memory                # shortcuts for the default core's attributes
+    pcs = core.pcs
+    entries = core.entries
+    mem_used = core.mem_used
     
     _opcodes = ("DAT", "MOV", "ADD", "SUB", "JMP", "JMZ", "JMN", "DJN", "CMP", "SPL", "END", "SLT", "EQU")
     _max_entries = 3
@@ -554,21 +1045,21 @@ class MARS:
             raise RedcodeSyntaxError("operands must be separated by a comma in '%s'" % s)
         return (',', s[1:])
         
-    # On pass 2, translate labels into integers
+    # On pass 2, translate labels into integers.  The result is a (mode, value) pair.
     
     def _translate(s, symbols, loc):
         if len(s) == 0:
-            return '#0'
+            return (Mode.IMMEDIATE, 0)
         if re.match(r'[@<#]', s):
-            mode = s[0]
+            mode = _mode_chars.index(s[0])
             sym = s[1:]
         else:
-            mode = ''
+            mode = Mode.DIRECT
             sym = s
         if re.match(r'[+-]?\d+$', sym):
-            return mode + sym
+            return (mode, int(sym))
         elif sym in symbols:
-            return mode + str(symbols[sym] - loc)
+            return (mode, symbols[sym] - loc)
         else:
             raise RedcodeSyntaxError("unknown/illegal label: %s" % sym)  
     
@@ -602,7 +1093,8 @@ class MARS:
         
         symbols[':start'] = 0            # default starting address
         
-        # Pass 1 -- Create a list of Word objects, build the symbol table
+        # Pass 1 -- Make a list of instructions (with operands still in string form), build
+        # the symbol table
         
         for (lineno, line) in enumerate(strings):
             line = line.rstrip()
@@ -633,31 +1125,35 @@ class MARS:
                 else:
                     if label:
                         symbols[label.upper()] = len(code)
-                    code.append(Word(op, a, b, lineno + 1))
+                    if op not in Word._optable:
+                        raise MARSError("Unknown opcode: " + str(op))
+                    code.append((op, a, b, lineno + 1))
             except RedcodeSyntaxError as e:
                 errors.append("  line %d: %s" % (lineno + 1, e.args[0]))
         
-        # Pass 2 -- translate labels into ints on each instruction
+        # Pass 2 -- translate labels into ints on each instruction and make the Word objects
         
-        for (loc, instr) in enumerate(code):
-            if instr._op == 'DAT' and len(instr._b) == 0:       # if DAT has only one operand
-                instr._a, instr._b = instr._b, instr._a         # it needs to be the B operand
+        for (loc, (op, a, b, lineno)) in enumerate(code):
+            if op == 'DAT' and len(b) == 0:         # if DAT has only one operand
+                a, b = b, a                         # it needs to be the B operand
             try:
-                instr._a = MARS._translate(instr._a, symbols, loc)
-                instr._b = MARS._translate(instr._b, symbols, loc)
+                amode, aval = MARS._translate(a, symbols, loc)
+                bmode, bval = MARS._translate(b, symbols, loc)
             except RedcodeSyntaxError as e:
                 errors.append("  line %d: %s" % (loc, e.args[0]))
+                amode, aval, bmode, bval = Mode.IMMEDIATE, 0, Mode.IMMEDIATE, 0
+            code[loc] = Word._from_fields(_opnames.index(op), amode, aval, bmode, bval, lineno)
                 
         return name, code, symbols, errors
 
+    # The methods that load and run programs are passed on to the default core 
+    
     def check_loc(lb, ub):
         """
         [MARSLab] See if the range of addresses between lb and ub overlap any of the
         memory segments currently in use.
         """
-        for (i, j) in MARS.mem_used:
-            if not (ub < i or lb > j):  return False
-        return True
+        return MARS.core.check_loc(lb, ub)
         
     def use_loc(addr, n):
         """
@@ -668,18 +1164,7 @@ class MARS:
         past the end of memory add two segments to the mem_used list, one at the end
         of memory and one for the wraparound.
         """
-        buf = MARS_runtime_options['buffer']
-        lb = addr - buf
-        ub = addr + n + buf - 1
-        if lb < 0:
-            MARS.mem_used.append( (0, ub) )
-            MARS.mem_used.append( (_memsize + lb, _memsize - 1) )
-        elif ub >= _memsize:
-            MARS.mem_used.append( (lb, _memsize - 1) )
-            MARS.mem_used.append( (0, ub - _memsize) )
-        else:
-            MARS.mem_used.append( (lb, ub) )
-        
+        MARS.core.use_loc(addr, n)
         
     def load(prog, addr = None):
         """
@@ -688,68 +1173,25 @@ class MARS:
         specified the program is loaded into a random address sufficiently far from
         any other program currently in memory.
         """
-        slot = len(MARS.entries)
-        
-        if slot == _maxentries:
-            print("Maximum number of entries (%d) already loaded" % _maxentries)
-            return None
-        
-        w = Warrior(prog)
-        
-        if len(w._code) > _memsize // 4:
-            print("Exceeds maximum program size (%d); code not loaded" % _memsize // 4)
-            return None
-        
-        if addr is not None:
-#             if not MARS.check_loc(addr, addr + len(w._code)):
-#                 print("Too close to another program; choose a different address")
-#                 return None
-            pass
-        else:
-            while True:
-                addr = randint(0, _memsize-1)
-                if MARS.check_loc(addr, addr + len(w._code)):  break
-        
-        w._start = addr
-        addrlist = []
-        MARS.use_loc(addr, len(w._code))
-        for (i, instr) in enumerate(w._code):
-            MARS.memory.store(addr+i, instr)
-            addrlist.append(addr+i)
-        
-        MARS.entries.append(w)
-        MARS.pcs.append( PC(w._name, addr+w._symbols[':start'], _memsize) )
-        if Canvas.view:
-            MARS.update_cells(addrlist, slot)
-        
-        return w
+        return MARS.core.load(prog, addr)
         
     def alive(i):
         """
         [MARSLab] Return True if program i is still alive.
         """
-        if i < len(MARS.entries):
-            if len(MARS.pcs[i]._addrs) > 0:
-                return True
-        return False
+        return MARS.core.alive(i)
         
     def num_alive():
         """
         [MARSLab] Return the number of programs that are still alive.
         """
-        n = 0
-        for pc in MARS.pcs:
-            if len(pc._addrs) > 0:  n += 1
-        return n
+        return MARS.core.num_alive()
         
     def status():
         """
         [MARSLab] Print information about programs loaded into memory.
         """
-        if len(MARS.entries) == 0:
-            print("No programs loaded")
-        for (i, w) in enumerate(MARS.entries):
-            print("%-10s: %4d..%-4d  PC: %s" % (w._name, w._start, w._start+len(w._code)-1, str(MARS.pcs[i])))
+        MARS.core.status()
     
     def step():
         """
@@ -759,28 +1201,7 @@ class MARS:
         the next thread.  The call to increment returns None if there are no surviving
         threads.
         """
-        if len(MARS.entries) == 0:
-            print("No programs loaded")
-            return 0
-                
-        for (i, pc) in enumerate(MARS.pcs):
-            addr = pc.increment()
-            if addr != None:
-                instr = MARS.memory.fetch(addr)
-                # print(i, addr, ":", instr)
-                try:
-                    state = instr.execute(pc, MARS.memory)
-                except MARSRuntimeException as e:
-                    print("Program %s at address %d: %s" % (MARS.entries[i]._name, addr, e.args[0]))
-                    state = 'halt'
-                if state == 'halt':
-                    pc.kill_thread()
-                    if Canvas.view:
-                        MARS.blacken_cell(addr)
-                elif Canvas.view:
-                    MARS.update_cells(pc._history, i)
-        if Canvas.view:
-            Canvas.update()
+        return MARS.core.step()
 
     def run(nsteps = None, single = False):
         """
@@ -790,25 +1211,13 @@ class MARS:
         programs drops to 1, i.e. one program has won the war.  To continue running
         a single program (e.g. for debugging) set single to True.
         """
-        if nsteps == None:
-            nsteps = MARS_runtime_options['maxRounds']
-        minsurvivors = 1 if single else 2
-        while nsteps > 0 and MARS.num_alive() >= minsurvivors:
-            MARS.step()
-            nsteps -= 1
-        if nsteps > 0:
-            return "halted"
+        return MARS.core.run(nsteps, single)
 
     def reset():
         """
         [MARSLab] Clear all the programs from memory.
         """
-        MARS.memory = Memory(_memsize)
-        MARS.pcs = [ ]
-        MARS.entries = [ ]
-        MARS.mem_used = [ ]
-        if Canvas.view:
-            MARS.view(**Canvas.view.options)
+        MARS.core.reset()
 
     def view(**view_options):
         """
@@ -874,6 +1283,157 @@ class MARS:
         cell = Canvas.view.cells[addr]
         Canvas.drawing.itemconfigure(cell.id, fill = 'black')
         
+## Tournaments
+
+_tournament_options = {
+    'rounds' : 10,
+    'steps' : None,
+    'size' : _memsize,
+    'max_processes' : None,
+    'seed' : None,
+    'workers' : None,
+}
+
+class Tournament:
+    """
+    [MARSLab] A Tournament plays every pair of programs from a list of Redcode programs 
+    against each other for a number of rounds and keeps track of the number of wins, 
+    losses, and ties.  Battles are run in a pool of worker processes.
+    """
+    
+    def __init__(self, programs, **user_options):
+        """
+        [MARSLab] Assemble the programs (each item in the list is either the name of a file
+        or a list of instructions) for a tournament.  Options and their defaults are:
+            rounds :    10             number of battles for each pair of programs
+            steps :     None           maximum number of steps in a battle (default: the 
+                                       maxRounds runtime option)
+            size :      4096           number of memory cells in the core
+            max_processes : None       maximum number of threads for each program
+            seed :      None           an integer to make the tournament repeatable; the 
+                                       results do not depend on the number of workers
+            workers :   None           maximum number of processes (default: one per CPU)
+        """
+        self._options = dict(_tournament_options)
+        self._options.update(user_options)
+        if len(programs) < 2:
+            raise MARSError("a tournament needs at least two programs")
+        self._warriors = []
+        for prog in programs:
+            w = Warrior(prog)
+            if len(w._code) == 0:
+                raise MARSError("no code for %s" % (prog if type(prog) == str else w._name))
+            if len(w._code) > self._options['size'] // 4:
+                raise MARSError("%s exceeds maximum program size (%d)" % (w._name, self._options['size'] // 4))
+            self._warriors.append(w)
+        self._results = self._empty_results()
+        
+    def __repr__(self):
+        return "<%s programs: %s>" % (classname(self), ' '.join(self.names()))
+        
+    def names(self):
+        "[MARSLab] Return a list with the names of the programs in this tournament."
+        return [w._name for w in self._warriors]
+        
+    def results(self):
+        """
+        [MARSLab] Return the results matrix.  Item [i][j] is a list with the number of 
+        wins, losses, and ties for program i when it played program j (items on the 
+        diagonal are None).
+        """
+        return self._results
+        
+    def run(self):
+        """
+        [MARSLab] Play every pair of programs for the number of rounds specified in the
+        options and return the results matrix.  For each battle the first program is 
+        loaded at a random address and the second at a random address at least buffer 
+        words away (the buffer runtime option), using a random number generator seeded
+        for that battle.  Programs take turns going first in alternate rounds.  A battle 
+        is a tie if both programs are still running (or both have died) after the 
+        maximum number of steps.  Results of any previous call to run are discarded.
+        """
+        options = self._options
+        steps = options['steps'] or MARS_runtime_options['maxRounds']
+        base = options['seed'] if options['seed'] is not None else getrandbits(32)
+        n = len(self._warriors)
+        self._results = self._empty_results()
+        battles = []
+        for i in range(n):
+            for j in range(i+1, n):
+                for r in range(options['rounds']):
+                    rng = Random("%d:%d:%d:%d" % (base, i, j, r))
+                    first, second = (i, j) if r % 2 == 0 else (j, i)
+                    battles.append((first, second, self._placement(first, second, rng), steps))
+        if options['workers'] == 1:
+            core = Core(options['size'], max_processes = options['max_processes'])
+            outcomes = [_battle(*b, warriors = self._warriors, core = core) for b in battles]
+        else:
+            initargs = (self._warriors, options['size'], options['max_processes'])
+            with ProcessPoolExecutor(options['workers'], initializer = _init_tournament, initargs = initargs) as pool:
+                outcomes = list(pool.map(_battle, *zip(*battles), chunksize = max(1, len(battles) // 64)))
+        for ((first, second, addrs, steps), alive) in zip(battles, outcomes):
+            if alive[0] == alive[1]:
+                self._results[first][second][2] += 1
+                self._results[second][first][2] += 1
+            else:
+                winner, loser = (first, second) if alive[0] else (second, first)
+                self._results[winner][loser][0] += 1
+                self._results[loser][winner][1] += 1
+        return self._results
+        
+    def standings(self):
+        """
+        [MARSLab] Return a list of (name, score) pairs, sorted by score, where a program 
+        gets 3 points for each win and 1 for each tie.
+        """
+        scores = []
+        for (i, w) in enumerate(self._warriors):
+            score = sum(3 * x[0] + x[2] for x in self._results[i] if x is not None)
+            scores.append((w._name, score))
+        return sorted(scores, key = lambda x: x[1], reverse = True)
+        
+    def _empty_results(self):
+        n = len(self._warriors)
+        return [[None if i == j else [0, 0, 0] for j in range(n)] for i in range(n)]
+        
+    # Choose load addresses for a battle:  the first program goes anywhere, the second
+    # somewhere in the free part of memory, leaving buffer words on either side
+    
+    def _placement(self, first, second, rng):
+        n1 = len(self._warriors[first]._code)
+        n2 = len(self._warriors[second]._code)
+        size = self._options['size']
+        buffer = MARS_runtime_options['buffer']
+        free = size - n1 - n2 - 2 * buffer
+        if free < 1:
+            buffer = 0
+            free = size - n1 - n2 + 1
+        a = rng.randrange(size)
+        b = (a + n1 + buffer + rng.randrange(free)) % size
+        return (a, b)
+            
+# Each worker process makes one Core when it starts, along with its own copy of the 
+# programs; the core is cleared before each battle.  The result of a battle is a pair
+# of booleans telling whether each program was still alive at the end.
+
+_tournament_warriors = None
+_tournament_core = None
+
+def _init_tournament(warriors, size, max_processes):
+    global _tournament_warriors, _tournament_core
+    _tournament_warriors = warriors
+    _tournament_core = Core(size, max_processes = max_processes)
+    
+def _battle(first, second, addrs, steps, warriors = None, core = None):
+    warriors = warriors or _tournament_warriors
+    core = core or _tournament_core
+    core.reset()
+    core.load(warriors[first], addrs[0])
+    core.load(warriors[second], addrs[1])
+    core.run(steps)
+    return (core.alive(0), core.alive(1))
+
 ## MiniMARS
 
 class MiniMARS(object):
@@ -929,7 +1489,7 @@ class MiniMARS(object):
 #             raise MARSRuntimeException("MiniMARS program has halted")
             return 'machine halted'
         instr = self._mem.fetch(self._pc.increment())
-        if instr._op == 'SPL':
+        if instr._op == Opcode.SPL:
             raise MARSRuntimeException("MiniMARS programs are single-threaded")
         self._state = instr.execute(self._pc, self._mem)
         return instr
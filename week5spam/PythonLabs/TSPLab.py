@@ -6,13 +6,27 @@ import PythonLabs
 from .Tools import RandomList, classname, path_to_data
 from .Canvas import Canvas
 import os
-from copy import copy
-from random import random, randint
-from math import sqrt, fsum, ceil
-from functools import reduce
+import sys
+import mmap
+import pickle
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from random import Random, random, randint, getrandbits, seed, getstate, setstate
+from math import sqrt, fsum, ceil, exp, log, lgamma, inf
+from math import factorial as _math_factorial
+from time import perf_counter
+from functools import lru_cache
+from heapq import heappush, heapreplace, nsmallest, nlargest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None                           # the 'numpy' backend for esearch is optional
 
 class TSPError(Exception):  pass
 
+_map_magic = b'#TSPLab binary map\n'
+
 # Convenience
 
 def summary(pop):
@@ -20,15 +34,65 @@ def summary(pop):
 
 # Combinations and permutations
 
+# Factorials up to _factorial_cache_size are saved in a list the first time they are
+# computed; larger ones are computed by the math library each time.
+
+_factorials = [1]
+_factorial_cache_size = 1024
+
 def factorial(n):
     "Compute the factorial of n:  n * (n-1) * (n-2) * ... 1."
-    from operator import mul
-    return reduce(mul, range(1,n+1))
+    if n < 0:
+        raise TSPError("factorial of a negative number")
+    if n >= _factorial_cache_size:
+        return _math_factorial(n)
+    while len(_factorials) <= n:
+        _factorials.append(_factorials[-1] * len(_factorials))
+    return _factorials[n]
 
 def ntours(n):
     "Compute the number of unique tours on a map with n cities."
     return factorial(n-1) // 2
     
+def log_factorial(n):
+    "Return the natural log of n!, computed without computing n! itself."
+    return lgamma(n + 1)
+    
+def log_ntours(n):
+    "Return the natural log of ntours(n) (or -inf if there are fewer than 3 cities)."
+    return lgamma(n) - log(2) if n >= 3 else -inf
+    
+# Rough speeds of the exact solvers, measured on a laptop:  the number of tours per
+# second generated by xsearch, and the number of steps per second (where Held-Karp on
+# n cities takes n * n * 2**n steps) for the Python and NumPy versions of bsearch.
+
+_xsearch_rate = 4.0e5
+_held_karp_rate = 1.0e7
+_np_held_karp_rate = 1.5e8
+
+def solver_budget(m, budget = 10.0):
+    """
+    [TSPLab] Choose a search function for map m (or for a map with m cities, if m is an
+    integer) that should finish within a time budget (in seconds).  Returns a tuple with
+    the name of the function and the predicted time.  If an exact solver, 'xsearch' or
+    'bsearch' (using dynamic programming), is predicted to finish within the budget the
+    faster of the two is chosen; otherwise the result is 'esearch' and the time is the
+    budget, since an evolutionary search can be stopped at any time.  Predictions are
+    made with logarithms so they work for maps of any size.
+    """
+    n = m if type(m) == int else m.size()
+    if n < 4:
+        return ('xsearch', 0.0)
+    limit = log(budget) if budget > 0 else -inf
+    choices = [('xsearch', log_ntours(n) - log(_xsearch_rate))]
+    if n <= _bsearch_options['dpmax']:
+        rate = _held_karp_rate if np is None else _np_held_karp_rate
+        choices.append(('bsearch', 2 * log(n-1) + (n-1) * log(2) - log(rate)))
+    name, t = min(choices, key = lambda x: x[1])
+    if t <= limit:
+        return (name, exp(t))
+    return ('esearch', budget)
+    
 def each_permutation(a):
     """
     Generate all permutations of iterable object a.  If a is a string the output will
@@ -63,6 +127,8 @@ def each_permutation(a):
 
 # Maps
 
+_mask64 = (1 << 64) - 1
+
 class Map:
     """
     [TSPLab] A Map is a 2D array of distances between pairs of cities.  Use the index 
@@ -70,40 +136,134 @@ class Map:
     m, call m[a,b] to find the distance between cities a and b.
     """
     
-    def __init__(self, arg):
+    def __init__(self, arg, lazy = False, cache = None):
         """
         Create a new Map object.  If the argument is an integer n make a map with n
         cities at random locations (see the method make_random_map for a description of
         how the cities are chosen).  If the argument is a string, read a file with that
         name, either from from the TSPLab data directory (if the name starts with a colon)
         or from the user's current directory.
+        
+        Pass lazy = True to make a map that only stores the coordinates of the cities and
+        computes the straight-line distance between two cities each time it is needed 
+        (a distance matrix for n cities needs n * n entries, which is too big for maps with
+        tens of thousands of cities).  The matrix section of a map file is ignored when the 
+        map is lazy.  The cache argument is the number of recently used distances a lazy 
+        map saves so it doesn't have to compute them again (the default is to not cache).
         """
         self._labels = []
-        self._dist = []
+        self._index = {}
+        self._dist = array('d')
         self._coords = []
-        self._maxdist = 0
+        self._n = 0
+        self._near = {}
+        self._grid = None
+        self._zkeys = None
+        self._lazy = lazy
+        self._cache = cache
+        self._xs = array('d')
+        self._ys = array('d')
+        self._mmap = None
         if type(arg) == str:
             self._read_map_file(arg)
         elif type(arg) == int:
             self._make_random_map(arg)
         else:
             raise TSPError("argument a in Map(a) must be an integer or a file name")
+        if lazy:
+            self._init_lazy()
             
     def __repr__(self):
         return "<%s %s>" % (classname(self), str(self._labels))
         
+    def close(self):
+        """
+        The distance matrix of a map read from a binary map file is used in place, so 
+        the file stays open (and on some systems can't be deleted or replaced) while the
+        map exists.  Call close to release the file when the map is no longer needed; 
+        the map can't be used after it is closed.  A map can also be used in a with 
+        statement, which closes it at the end.  Closing any other map does nothing.  
+        NumPy arrays made from the map by the search functions have to be deleted first.
+        """
+        if self._mmap is not None:
+            self._dist.release()
+            self._mmap.close()
+            self._dist = array('d')
+            self._mmap = None
+            
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *exc):
+        self.close()
+        
     def __getitem__(self, x):
         """
         Argument x is expected to be an (x,y) pair.  Return the distance between cities
         x and y. 
         """
         a, b = x
-        if a not in self._labels or b not in self._labels:  return None
-        i = self._labels.index(a)
-        j = self._labels.index(b)
-        if i < j:
-            i, j = j, i
-        return self._dist[i][j]
+        i = self._index.get(a)
+        j = self._index.get(b)
+        if i is None or j is None:  return None
+        return self.distance(i, j)
+        
+    def distance(self, i, j):
+        """
+        Return the distance between the cities at locations i and j in the list of city
+        names.  This is the same as m[a,b] except the arguments are integer indices instead
+        of city names (use the index method to find the index of a city).
+        """
+        return self._dist[i * self._n + j]
+        
+    def index(self, a):
+        "Return the index of city a, or None if a is not in this map"
+        return self._index.get(a)
+        
+    def label(self, i):
+        "Return the name of the city at index i"
+        return self._labels[i]
+        
+    def is_lazy(self):
+        "Return True if distances in this map are computed from city coordinates on demand"
+        return self._lazy
+        
+    # Random 64-bit keys for computing tour hashes (see Tour.edge_hash).  The key of a 
+    # link is the product of the keys of its two cities, so it is the same in both
+    # directions.  The keys come from their own generator so making them doesn't change
+    # the results of a search.
+    
+    def _link_keys(self):
+        if self._zkeys is None:
+            rng = Random(self._n)
+            self._zkeys = [rng.getrandbits(64) | 1 for i in range(self._n)]
+        return self._zkeys
+        
+    # Return the distance matrix as an n x n NumPy array (a view, not a copy); used
+    # by the vectorized search functions.  A lazy map returns an object that computes
+    # the distances for the rows and columns used in an index expression.
+    
+    def _np_matrix(self):
+        if self._lazy:
+            return _LazyMatrix(self)
+        return np.frombuffer(self._dist, dtype=np.float64).reshape(self._n, self._n)
+        
+    # Maps are pickled when they are sent to worker processes.  The distance function
+    # of a lazy map (and its cache) is rebuilt when the map is unpickled, and a matrix
+    # mapped from a binary file is copied into a regular array.
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('distance', None)
+        if isinstance(self._dist, memoryview):
+            state['_dist'] = array('d', self._dist)
+            state['_mmap'] = None
+        return state
+        
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._lazy:
+            self._init_lazy()
         
     def display(self, fw = None):
         """
@@ -128,10 +288,10 @@ class Map:
         
         # print rows
         fmt = '%' + '%d.2f' % fw
-        for (i, row) in enumerate(self._dist):
+        for i in range(self._n):
             s = city[i]
-            for d in row:
-                s += fmt % d
+            for j in range(i+1):
+                s += fmt % self.distance(i, j)
             print(s)
 
     def size(self):
@@ -142,6 +302,36 @@ class Map:
         "Return a list of city names for this map"
         return list(self._labels)
         
+    def save(self, filename, binary = False):
+        """
+        Write this map to a file.  The default is a text file in the same format as the
+        map files in the data directory, which can be read by passing the file name to
+        Map.  If binary is True the distances are saved as raw floating point numbers;
+        Map reads these files much faster since the distance matrix is mapped directly 
+        into memory.  A lazy map is saved without distances; when the file is read into
+        a map that is not lazy the distances are computed from the coordinates.
+        """
+        if None in self._coords:
+            raise TSPError("save needs coordinates for every city")
+        cities = ['%r %r %s\n' % (self._coords[i] + (self._labels[i],)) for i in range(self._n)]
+        full = not self._lazy
+        if binary:
+            header = (_map_magic + b'%d %s %d\n' % (self._n, sys.byteorder.encode(), full) + 
+                ''.join(cities).encode())
+            with open(filename, 'wb') as mapfile:
+                mapfile.write(header)
+                mapfile.write(bytes(-len(header) % 8))
+                if full:
+                    mapfile.write(self._dist)
+        else:
+            with open(filename, 'w') as mapfile:
+                mapfile.write(':map\n')
+                mapfile.writelines(cities)
+                if full:
+                    mapfile.write(':matrix\n')
+                    for i in range(self._n):
+                        mapfile.writelines(['%s %s %r\n' % (self._labels[i], self._labels[j], self.distance(i, j)) for j in range(i)])
+        
     def coords(self, a):
         "Return a tuple with the map coordinates of city a"
         return self._coords[self._index_of(a)]
@@ -159,24 +349,87 @@ class Map:
             make_tour('random')           make a tour of all cities in a random order
             make_tour('mutate', t1)       return a copy of t1 with a single point mutation
             make_tour('cross', t1, t2)    return a cross between tours t1 and t2.
+            make_tour('pmx', t1, t2)      same, but using partially mapped cross-over
+            make_tour('two_opt', t1)      return a copy of t1 with a random 2-opt move
+            make_tour('or_opt', t1)       return a copy of t1 with a random Or-opt move
+            make_tour('nearest')          build a tour by always going to the nearest city
+                                          not yet visited (pass start = x to start at city x)
+            make_tour('greedy')           build a tour by adding the shortest links first
+            make_tour('christofides-lite') build a tour from a minimal spanning tree
+        The last three kinds use the map coordinates to find nearby cities, so they work
+        best on maps where distances are proportional to distances on the map.
         """
         if kind == None:
-            tour = Tour(self, self._labels)
+            tour = Tour._from_indices(self, array('i', range(self._n)))
         elif type(kind) == list:
             tour = Tour(self, kind)
         elif kind == 'random':
-            tour = Tour(self, self._labels)
+            tour = Tour._from_indices(self, array('i', range(self._n)), 0.0)
             tour.permute()
+        elif kind == 'nearest':
+            tour = Tour._from_indices(self, _nearest_neighbor_path(self, **args))
+        elif kind == 'greedy':
+            tour = Tour._from_indices(self, _greedy_path(self))
+        elif kind == 'christofides-lite':
+            tour = Tour._from_indices(self, _christofides_path(self))
         elif kind == 'mutate' and type(t1) == Tour:
             tour = t1.clone()
             tour.mutate(**args)
         elif kind == 'cross' and type(t1) == Tour and type(t2) == Tour:
             tour = t1.clone()
             tour.cross(t2, **args)
+        elif kind == 'pmx' and type(t1) == Tour and type(t2) == Tour:
+            tour = t1.clone()
+            tour.pmx(t2, **args)
+        elif kind == 'two_opt' and type(t1) == Tour:
+            tour = t1.clone()
+            tour.two_opt(**args)
+        elif kind == 'or_opt' and type(t1) == Tour:
+            tour = t1.clone()
+            tour.or_opt(**args)
         else:
             raise TSPError("make_tour: unknown type: %s %s %s" % (str(kind), str(t1), str(t2)))
         return tour
         
+    def neighbors(self, city, k = 8):
+        """
+        Return a list of the k cities closest to city, in order of increasing distance.
+        Candidates are found with a spatial index of the map coordinates, then ordered by
+        their distances in the map.  Lists of neighbors are computed for all cities the
+        first time this method (or a search that uses neighbor lists) is called with a 
+        new value of k, and saved for later calls.
+        """
+        i = self._index.get(city)
+        if i is None:
+            raise TSPError("unknown city name:  %s" % str(city))
+        return [self._labels[j] for j in self._candidates(k)[i]]
+        
+    # Return a list with one entry for each city, where entry i is a list of the indices
+    # of the k cities closest to city i, in order of increasing distance.  Used by the
+    # local search operators and neighbor mutations to limit the number of moves they 
+    # consider.  Lists are computed the first time they are needed and saved in the map.
+    
+    def _candidates(self, k):
+        k = min(k, self._n - 1)
+        if k not in self._near:
+            grid = self._spatial_index()
+            dist = self.distance
+            near = [ ]
+            for i in range(self._n):
+                a = grid.nearest(self._coords[i], k, skip = i)
+                near.append(sorted(a, key = lambda j: dist(i, j)))
+            self._near[k] = near
+        return self._near[k]
+        
+    # Return the spatial index for this map, making it the first time it is needed.
+    
+    def _spatial_index(self):
+        if self._grid is None:
+            if None in self._coords:
+                raise TSPError("map does not have coordinates for every city")
+            self._grid = Grid(self._coords)
+        return self._grid
+        
     # A simple 'struct' used in the each_tour generator to associate a flag with each item
     # in the array of indices
     
@@ -193,14 +446,21 @@ class Map:
     # Method to generate all (n-1)! / 2 unique tours (avoiding duplicates that are either 
     # rotations or inversions of other tours)
         
-    def each_tour(self):
+    def each_tour(self, fast = False):
         """
         Generate all possible tours of this map.  Every tour starts in the first city (city 0 
         when city names are integers, or the first city read from the file).  Successive tours 
         are generated by the Johnson-Trotter algorithm, which makes permutations by exchanging 
         just two cities from the previous tour.  The Johnson-Trotter algorithm makes it possible 
         to stop iterating before repeating tours in reverse order.
+        
+        If fast is True the generator does not make Tour objects.  Instead it generates
+        (cost, path) pairs, where path is an array of city indices.  The same array is
+        updated in place on each iteration, so make a copy of any path that needs to be saved.
         """
+        if fast:
+            yield from self._each_tour_fast()
+            return
         # make a list of indices, each associated with the direction it will move; note that
         # index 0 is not in the list
         a = []
@@ -210,7 +470,7 @@ class Map:
         # on each iteration exchange two adjacent items in a to make a new permuations
         while True:
             # yield the list of labels appended to label 0 
-            yield Tour(self, [self._labels[0]] + [self._labels[x.value] for x in a])
+            yield Tour._from_indices(self, array('i', [0] + [x.value for x in a]))
             # find the rightmost movable item
             mover = None
             for i in range(0,len(a)):
@@ -235,6 +495,41 @@ class Map:
                 if a[i].value > k:
                     a[i].direction ^= True 
     
+    # Fast version of each_tour.  The tour is an array of city indices (tour[0] is always
+    # city 0), pos[v] is the location of city v in the tour, and left[v] is 1 if v is
+    # moving left.  The mover is the largest mobile city, found by checking cities from
+    # the largest down; most of the time the largest city is mobile, so on average only
+    # a few cities are checked.  Each exchange of neighbors changes just two links in the
+    # tour, so the cost is updated without summing over the whole path.
+    
+    def _each_tour_fast(self):
+        n = self._n
+        dist = self.distance
+        tour = array('i', range(n))
+        pos = array('i', range(n))
+        left = bytearray([1]) * n
+        cost = dist(tour[0], tour[-1]) + sum([dist(tour[i], tour[i+1]) for i in range(n-1)])
+        while True:
+            yield cost, tour
+            v = n - 1
+            while v > 2:
+                p = pos[v]
+                if left[v]:
+                    if p > 1 and tour[p-1] < v:  break
+                else:
+                    if p < n-1 and tour[p+1] < v:  break
+                v -= 1
+            # stop when 2 is the only city left to move (remaining tours are inversions)
+            if v <= 2:
+                break
+            p = pos[v] - 1 if left[v] else pos[v]
+            a, b, c, d = tour[p-1], tour[p], tour[p+1], tour[(p+2) % n]
+            cost += dist(a, c) + dist(b, d) - dist(a, b) - dist(c, d)
+            tour[p], tour[p+1] = c, b
+            pos[c], pos[b] = p, p+1
+            for u in range(v+1, n):
+                left[u] ^= 1
+    
     # Helper function for Johnson-Trotter algorithm
 
     @staticmethod
@@ -250,100 +545,434 @@ class Map:
     # Read a list of cities and pairwise distances from a file.  The first part of the
     # file (marked by :map) has coordinates and names of cities.  The second part (marked
     # by :matrix) should have n * (n-1) / 2 lines where each line has the distance between
-    # a pair of cities.
+    # a pair of cities.  The whole file is read at once and distances are stored directly
+    # in the matrix; the slower helper methods are only called to report errors.  Files 
+    # written by save with binary = True are recognized by their first line.
     
     def _read_map_file(self, filename):
+        with open(filename, 'rb') as mapfile:
+            if mapfile.read(len(_map_magic)) == _map_magic:
+                return self._read_binary_map(filename)
         section = None
         # if filename[0] == ':':
         #     filename = os.path.join(PythonLabs.datadir, "tsp", filename[1:])
             
         with open(filename) as bodyfile:
-            for line in bodyfile:
-                line = line.strip()
-                if len(line) == 0 or line[0] == '#':  continue
-                if line[0] == ':' :
-                    if line.startswith(':map'): 
-                        section = 'map'
-                    elif line.startswith(':matrix'): 
-                        section = 'matrix'
-                    else:
-                        raise TSPError("unknown map descriptor %s " % line)
-                    continue
-                if section == 'map':
-                    try:
-                        x, y, name = line.split()
-                        self._coords[self._index_of(name)] = (float(x), float(y))
-                    except ValueError:
-                        print("bad format for map entry: %s" % line)
-                elif section == 'matrix':
-                    try:
-                        a, b, d = line.split()
-                        dist = float(d)
-                        self._set_distance(a, b, dist)
-                        self._maxdist = max(self._maxdist, dist)
-                    except ValueError:
-                        print("bad format for map distance: %s" % line)
+            lines = bodyfile.read().splitlines()
+        for line in lines:
+            line = line.strip()
+            if len(line) == 0 or line[0] == '#':  continue
+            if line[0] == ':' :
+                if line.startswith(':map'): 
+                    section = 'map'
+                elif line.startswith(':matrix'): 
+                    if self._lazy:
+                        break
+                    section = 'matrix'
+                    self._init_matrix()
+                    index, dist, n = self._index, self._dist, self._n
                 else:
-                    pass    # in case future maps have other sections...
-                    
-        errs = []
-        for (i, row) in enumerate(self._dist):
-            for (j, dist) in enumerate(row):
-                if dist == None:
-                    errs.append((self._labels[i],self._labels[j]))
-        if len(errs) > 0:
+                    raise TSPError("unknown map descriptor %s " % line)
+                continue
+            if section == 'map':
+                try:
+                    x, y, name = line.split()
+                    self._coords[self._index_of(name)] = (float(x), float(y))
+                except ValueError:
+                    print("bad format for map entry: %s" % line)
+            elif section == 'matrix':
+                try:
+                    a, b, d = line.split()
+                    d = float(d)
+                except ValueError:
+                    print("bad format for map distance: %s" % line)
+                    continue
+                i = index.get(a)
+                j = index.get(b)
+                if i is None or j is None or i == j:
+                    self._set_distance(a, b, d)         # raises the appropriate error
+                dist[i * n + j] = d
+                dist[j * n + i] = d
+            else:
+                pass    # in case future maps have other sections...
+        
+        if self._lazy:
+            return
+        if len(self._dist) == 0:
+            self._init_matrix()
+            if None not in self._coords:        # no :matrix section, e.g. a saved lazy map
+                self._fill_distances()
+        if self._n > 1 and min(self._dist) < 0:
+            errs = []
+            for i in range(self._n):
+                for j in range(i):
+                    if self._dist[i * self._n + j] < 0:
+                        errs.append((self._labels[i],self._labels[j]))
             raise TSPError("Missing distances: %s" % str(errs))
         
+    # A binary map file starts with a line that identifies the format, followed by a 
+    # line with the number of cities, the byte order, and a flag that tells whether the
+    # file has a distance matrix.  Next are n lines with the coordinates and names of the 
+    # cities (the same as the :map section of a text file), padding to the next multiple
+    # of 8 bytes, and the matrix as n * n doubles.  The file is mapped into memory and the
+    # matrix is used in place, so large maps open without parsing or copying distances.
+    # The file stays mapped until the map is closed (see Map.close); if the matrix is 
+    # not used in place the file is closed when it has been read.
+    
+    def _read_binary_map(self, filename):
+        with open(filename, 'rb') as mapfile:
+            mm = mmap.mmap(mapfile.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            self._read_binary_contents(filename, mm)
+        finally:
+            if self._mmap is None:
+                mm.close()
+        
+    def _read_binary_contents(self, filename, mm):
+        mm.readline()
+        try:
+            n, order, full = mm.readline().split()
+            n, full = int(n), int(full)
+            for k in range(n):
+                x, y, name = mm.readline().decode().split()
+                self._coords[self._index_of(name)] = (float(x), float(y))
+        except ValueError:
+            raise TSPError("bad header in binary map file %s" % filename)
+        if self._lazy:
+            return
+        if not full:
+            self._init_matrix()
+            self._fill_distances()
+            return
+        self._n = n
+        start = -(-mm.tell() // 8) * 8
+        if len(mm) != start + 8 * n * n:
+            raise TSPError("binary map file %s is truncated" % filename)
+        if order.decode() == sys.byteorder:
+            self._dist = memoryview(mm)[start:].cast('d')
+            self._mmap = mm
+        else:
+            self._dist = array('d')
+            self._dist.frombytes(mm[start:])
+            self._dist.byteswap()
+        
     # Return the index of city a, extending the city list and adding a if necessary.
-    # When adding a new city, initialize its coordinates and row in the distance matrix.
+    # When adding a new city, initialize its coordinates.  All cities have to be defined
+    # before the distance matrix is allocated.
         
     def _index_of(self, a):
-        if a not in self._labels:
+        i = self._index.get(a)
+        if i is None:
+            if len(self._dist) > 0:
+                raise TSPError("city %s defined after the distance matrix" % str(a))
             i = len(self._labels)
             self._labels.append(a)
             self._coords.append(None)
-            self._dist.append([None]*(i+1))
-            self._dist[i][i] = 0
-        else:
-            i = self._labels.index(a)
+            self._index[a] = i
         return i
         
+    # Allocate the distance matrix once the number of cities is known.  The matrix is a
+    # flat n x n array of doubles, stored by rows, with a copy of each distance above and
+    # below the diagonal so lookups don't need to order the indices.  Entries that have
+    # not been set yet are -1.
+    
+    def _init_matrix(self):
+        n = len(self._labels)
+        self._n = n
+        self._dist = array('d', [-1.0]) * (n * n)
+        for i in range(n):
+            self._dist[i * n + i] = 0.0
+        
+    # Set up a lazy map:  copy the coordinates into a pair of arrays and replace the
+    # distance method with one that computes distances from the coordinates, wrapped
+    # in an LRU cache if the map was made with a cache size.
+    
+    def _init_lazy(self):
+        if None in self._coords:
+            missing = [self._labels[i] for i in range(len(self._coords)) if self._coords[i] is None]
+            raise TSPError("lazy map needs coordinates for every city: %s" % str(missing))
+        self._n = len(self._labels)
+        self._xs = array('d', [p[0] for p in self._coords])
+        self._ys = array('d', [p[1] for p in self._coords])
+        xs, ys = self._xs, self._ys
+        def distance(i, j):
+            dx = xs[i] - xs[j]
+            dy = ys[i] - ys[j]
+            return sqrt(dx*dx + dy*dy)
+        if self._cache:
+            distance = lru_cache(maxsize = self._cache)(distance)
+        self.distance = distance
+        
     # Save the distance between cities a, b.
     
     def _set_distance(self, a, b, d):
-        if a not in self._labels:  
+        i = self._index.get(a)
+        j = self._index.get(b)
+        if i is None:  
             raise TSPError("unknown city name:  %s" % str(a))
-        if b not in self._labels:  
+        if j is None:  
             raise TSPError("unknown city name:  %s" % str(b))
-        if a == b:  
+        if i == j:  
             raise TSPError("can't assign to diagonal %s" % str(a))
-        i = self._labels.index(a)
-        j = self._labels.index(b)
-        if i < j:
-            i, j = j, i
-        self._dist[i][j] = d
+        self._dist[i * self._n + j] = d
+        self._dist[j * self._n + i] = d
     
     # Make a map with n random cities.  To make interesting drawings, there are 400
     # potetntial cities in a 20 x 20 grid.  Draw n at random, and tweak their (x,y)
     # coordinates to move them slightly.  Use our own RandomList class to get n 
-    # unique random integers between 0 and 399.
+    # unique random integers between 0 and 399.  Maps with more than 200 cities use
+    # a finer grid (at least 2n points) covering the same area of the canvas.
     
     def _make_random_map(self, n):
         self._ids = []
-        for (i,city) in enumerate(RandomList(n, 400)):
-            x, y = divmod(city, 20)
-            x = (20 * x) + randint(0,5) + 50
-            y = (20 * y) + randint(0,5) + 50
+        g = 20 if n <= 200 else ceil(sqrt(2 * n))
+        for (i,city) in enumerate(RandomList(n, g * g)):
+            x, y = divmod(city, g)
+            if g == 20:
+                x = (20 * x) + randint(0,5) + 50
+                y = (20 * y) + randint(0,5) + 50
+            else:
+                x = (400 * (x + random() / 4)) / g + 50
+                y = (400 * (y + random() / 4)) / g + 50
             self._coords[self._index_of(i)] = (x,y)
             self._ids.append(city)
+        if self._lazy:
+            return
+        self._init_matrix()
+        self._fill_distances()
+        
+    # Set every entry of the distance matrix to the straight-line distance between the
+    # coordinates of the two cities.
+    
+    def _fill_distances(self):
+        n = self._n
         for i in range(n):
+            xi, yi = self._coords[i]
             for j in range(0,i):
-                xi, yi = self._coords[i]
                 xj, yj = self._coords[j]
                 d = sqrt((xi - xj)**2 + (yi - yj)**2)
-                self._dist[i][j] = d
-                self._maxdist = max(self._maxdist, d)
+                self._dist[i * n + j] = d
+                self._dist[j * n + i] = d
+    
+# A stand-in for the NumPy distance matrix of a lazy map.  Index it the same way as 
+# the matrix (D[P,Q] for arrays P and Q of the same shape, or D[a:b,c:d] for a block)
+# to get an array of distances computed from the coordinates of the cities.
+
+class _LazyMatrix:
+    
+    def __init__(self, m):
+        self._x = np.frombuffer(m._xs, dtype=np.float64)
+        self._y = np.frombuffer(m._ys, dtype=np.float64)
+        self._n = m._n
+        
+    def __getitem__(self, key):
+        a, b = key
+        if isinstance(a, slice) and isinstance(b, slice):
+            a = np.arange(self._n)[a][:,None]
+            b = np.arange(self._n)[b][None,:]
+        return np.hypot(self._x[a] - self._x[b], self._y[a] - self._y[b])
+        
+# Spatial index
+
+class Grid:
+    """
+    [TSPLab] A Grid is a spatial index for a set of points.  The points are placed in
+    buckets, where each bucket is a square region of the map, with an average of two 
+    points per bucket.  To find the points closest to a location, search the bucket the
+    location is in, then the ring of buckets around it, and so on, until none of the 
+    remaining buckets can hold a point closer than the ones already found.
+    """
     
+    def __init__(self, coords):
+        """
+        Make a grid for a list of (x,y) coordinates.  Points are identified by their
+        location in the list.
+        """
+        self._coords = list(coords)
+        xs = [p[0] for p in self._coords]
+        ys = [p[1] for p in self._coords]
+        self._x0, self._y0 = min(xs), min(ys)
+        self._side = max(1, int(sqrt(len(self._coords) / 2)))
+        extent = max(max(xs) - self._x0, max(ys) - self._y0)
+        self._size = extent / self._side if extent > 0 else 1.0
+        self._cells = [[] for i in range(self._side * self._side)]
+        for (i, p) in enumerate(self._coords):
+            self._cells[self._cell(p)].append(i)
+    
+    def __repr__(self):
+        return "<%s %d x %d>" % (classname(self), self._side, self._side)
+    
+    def remove(self, i):
+        "Remove point i from the index (used when building a tour one city at a time)."
+        self._cells[self._cell(self._coords[i])].remove(i)
+        
+    def nearest(self, p, k = 1, skip = None):
+        """
+        Return a list of the (up to) k points closest to location p, in order of
+        increasing distance.  If skip is not None that point is left out of the result.
+        """
+        side = self._side
+        x, y = p
+        cx, cy = self._cell_xy(p)
+        found = []
+        for r in range(side + 1):
+            for (gx, gy) in Grid._ring(cx, cy, r):
+                if 0 <= gx < side and 0 <= gy < side:
+                    for i in self._cells[gx * side + gy]:
+                        if i != skip:
+                            qx, qy = self._coords[i]
+                            found.append(((qx - x)**2 + (qy - y)**2, i))
+            if len(found) >= k:
+                found.sort()
+                del found[k:]
+                if found[-1][0] <= (r * self._size) ** 2:
+                    break
+        found.sort()
+        return [i for (d, i) in found[:k]]
+        
+    def _cell_xy(self, p):
+        cx = min(self._side - 1, int((p[0] - self._x0) / self._size))
+        cy = min(self._side - 1, int((p[1] - self._y0) / self._size))
+        return cx, cy
+        
+    def _cell(self, p):
+        cx, cy = self._cell_xy(p)
+        return cx * self._side + cy
+        
+    @staticmethod
+    def _ring(cx, cy, r):
+        if r == 0:
+            return [(cx, cy)]
+        a = [(cx + d, cy - r) for d in range(-r, r+1)] + [(cx + d, cy + r) for d in range(-r, r+1)]
+        a += [(cx - r, cy + d) for d in range(-r+1, r)] + [(cx + r, cy + d) for d in range(-r+1, r)]
+        return a
+        
+# Tour construction.  Each of these functions returns the path (an array of city indices)
+# for a new tour; they are called by Map.make_tour.
+
+# Nearest neighbor:  start at a city and keep going to the closest unvisited city.  The
+# grid is a private copy, since visited cities are removed from it.
+
+def _nearest_neighbor_path(m, start = None):
+    grid = Grid(m._coords)
+    i = 0 if start is None else m.index(start)
+    if i is None:
+        raise TSPError("unknown city name:  %s" % str(start))
+    path = array('i', [i])
+    grid.remove(i)
+    for k in range(m.size() - 1):
+        i = grid.nearest(m._coords[i])[0]
+        grid.remove(i)
+        path.append(i)
+    return path
+
+# Greedy edge:  consider links in order of increasing length, adding a link if neither 
+# city already has two links and the link does not close a loop.  To save time the only
+# links considered connect each city to one of its 10 closest cities on the map, so the
+# result may be several paths; these are joined end to end, each time going to the 
+# closest free end of another path.
+
+def _greedy_path(m):
+    n = m.size()
+    grid = m._spatial_index()
+    dist = m.distance
+    links = set()
+    for i in range(n):
+        for j in grid.nearest(m._coords[i], 10, skip = i):
+            links.add((min(i, j), max(i, j)))
+    
+    adj = [[] for i in range(n)]
+    group = list(range(n))              # union-find forest, to avoid closing loops
+    def root(i):
+        while group[i] != i:
+            group[i] = group[group[i]]
+            i = group[i]
+        return i
+    for (i, j) in sorted(links, key = lambda x: dist(x[0], x[1])):
+        if len(adj[i]) < 2 and len(adj[j]) < 2 and root(i) != root(j):
+            adj[i].append(j)
+            adj[j].append(i)
+            group[root(i)] = root(j)
+    
+    fragments = []                      # walk each path from one of its ends
+    seen = bytearray(n)
+    for i in range(n):
+        if len(adj[i]) < 2 and not seen[i]:
+            frag = [i]
+            seen[i] = 1
+            prev, cur = None, i
+            while True:
+                nxt = [j for j in adj[cur] if j != prev]
+                if len(nxt) == 0 or seen[nxt[0]]:  break
+                prev, cur = cur, nxt[0]
+                frag.append(cur)
+                seen[cur] = 1
+            fragments.append(frag)
+    
+    path = fragments.pop(0)
+    while fragments:
+        end = path[-1]
+        best = None
+        for (k, frag) in enumerate(fragments):
+            for (d, flip) in [(dist(end, frag[0]), False), (dist(end, frag[-1]), True)]:
+                if best is None or d < best[0]:
+                    best = (d, k, flip)
+        d, k, flip = best
+        frag = fragments.pop(k)
+        path += reversed(frag) if flip else frag
+    return array('i', path)
+
+# "Christofides lite":  make a minimal spanning tree, then add links to pair up the
+# cities that have an odd number of links in the tree (Christofides' algorithm uses an
+# optimal matching, this version simply links each odd city to the closest unmatched one).
+# Every city now has an even number of links, so there is a circuit that uses every link
+# exactly once; the tour visits cities in the order they first appear in the circuit.
+# Prim's algorithm for the tree uses every distance, so this method takes O(n^2) time.
+
+def _christofides_path(m):
+    n = m.size()
+    if n < 3:                           # only one tour, and no odd cities to match if n == 1
+        return array('i', range(n))
+    dist = m.distance
+    adj = [[] for i in range(n)]
+    key = { i : (dist(0, i), 0) for i in range(1, n) }
+    while key:
+        i = min(key, key = lambda x: key[x][0])
+        d, j = key.pop(i)
+        adj[i].append(j)
+        adj[j].append(i)
+        for x in key:
+            if dist(i, x) < key[x][0]:
+                key[x] = (dist(i, x), i)
+    
+    odd = [i for i in range(n) if len(adj[i]) % 2 == 1]
+    grid = Grid([m._coords[i] for i in odd])
+    matched = bytearray(len(odd))
+    for a in range(len(odd)):
+        if matched[a]:  continue
+        grid.remove(a)
+        b = grid.nearest(m._coords[odd[a]])[0]
+        grid.remove(b)
+        matched[a] = matched[b] = 1
+        adj[odd[a]].append(odd[b])
+        adj[odd[b]].append(odd[a])
+    
+    path = array('i')                   # Hierholzer's algorithm, skipping repeated cities
+    seen = bytearray(n)
+    stack = [0]
+    while stack:
+        i = stack[-1]
+        if adj[i]:
+            j = adj[i].pop()
+            adj[j].remove(i)
+            stack.append(j)
+        else:
+            stack.pop()
+            if not seen[i]:
+                seen[i] = 1
+                path.append(i)
+    return path
+
 # Tours
 
 class Tour:
@@ -357,6 +986,11 @@ class Tour:
     create a new tour instead of calling Tour() directly.
     """
     
+    # Internally the path is an array of integer city indices (see Map.index); city
+    # names are only looked up when a path is printed or returned to the user.
+    
+    __slots__ = ('_matrix', '_path', '_cost', '_id', '_alive', '_hash', '_pos')
+    
     _count = 0                         # class variable to keep track of the number of tours
     
     @staticmethod
@@ -377,15 +1011,35 @@ class Tour:
         """
         if len(a) < 3:
             raise TSPError("tours must have at least 3 cities")
+        path = array('i')
+        for city in a:
+            i = m.index(city)
+            if i is None:
+                raise TSPError("unknown city name:  %s" % str(city))
+            path.append(i)
+        Tour._init(self, m, path, None)
+        
+    # Initialize a tour from an array of city indices (the array is not copied).  If
+    # the cost is already known pass it in, otherwise it is computed from the path.
+    
+    def _init(self, m, path, cost):
         self._matrix = m
-        self._path = copy(a)
-        self._cost = self.pathcost()
+        self._path = path
+        self._cost = self.pathcost() if cost is None else cost
         self._id = Tour._count
         self._alive = True
+        self._hash = None               # computed when edge_hash is first called
+        self._pos = None                # made when a neighbor mutation needs it
         Tour._count += 1
         
+    @staticmethod
+    def _from_indices(m, path, cost = None):
+        tour = Tour.__new__(Tour)
+        tour._init(m, path, cost)
+        return tour
+        
     def __repr__(self):
-        return "<%s %s %.3f>" % (classname(self), str(self._path), self._cost)
+        return "<%s %s %.3f>" % (classname(self), str(list(self.path())), self._cost)
     
     def __lt__(self, rhs):
         "[TSPLab] Compare two tours based on their costs."
@@ -394,12 +1048,51 @@ class Tour:
     def clone(self):
         """
         Make a "deep copy" of this tour object, giving it a copy of the list of cities.
+        The copy has the same cost, so it is not recomputed.
+        """
+        tour = Tour._from_indices(self._matrix, array('i', self._path), self._cost)
+        tour._hash = self._hash
+        if self._pos is not None:
+            tour._pos = array('i', self._pos)
+        return tour
+        
+    # Return an array with the location of each city in this tour, making it the first
+    # time it is needed.  Exchange mutations and 2-opt moves keep it up to date; other
+    # changes to the path discard it.
+    
+    def _locations(self):
+        if self._pos is None:
+            self._pos = array('i', _positions(self._path))
+        return self._pos
+        
+    def edge_hash(self):
+        """
+        Return a 64-bit number computed from the set of links in this tour.  Tours that
+        have the same links have the same hash, even if they start at different cities
+        or go in the opposite direction.  The hash is computed the first time this method
+        is called; after that point mutations, 2-opt moves, and Or-opt moves update it
+        in constant time.
         """
-        return Tour(self._matrix, self._path)
+        if self._hash is None:
+            self._hash = self._links_hash(range(len(self._path)))
+        return self._hash
+        
+    # XOR of the keys of the links that start at locations in a (each link goes from
+    # a location to the next one in the path).
+        
+    def _links_hash(self, a):
+        path = self._path
+        keys = self._matrix._link_keys()
+        n = len(path)
+        h = 0
+        for i in a:
+            h ^= (keys[path[i]] * keys[path[(i+1) % n]]) & _mask64
+        return h
         
     def path(self):
         "Return a tuple made from this tour's path."
-        return tuple(self._path)
+        labels = self._matrix._labels
+        return tuple([labels[i] for i in self._path])
         
     def cost(self):
         "Return this tour's cost"
@@ -421,9 +1114,11 @@ class Tour:
         automatically by calls to mutate and cross, but this method is used in unit tests 
         to make sure the cost is updated properly by the mutation methods.
         """
-        cost = self._matrix[ self._path[0], self._path[-1] ]
-        for i in range(len(self._path)-1):
-            cost += self._matrix[ self._path[i], self._path[i+1] ]
+        path = self._path
+        dist = self._matrix.distance
+        cost = dist(path[0], path[-1])
+        for i in range(len(path)-1):
+            cost += dist(path[i], path[i+1])
         return cost
         
     def permute(self):
@@ -436,6 +1131,8 @@ class Tour:
             r = randint(i, len(a)-1)
             a[i], a[r] = a[r], a[i]
         self._cost = self.pathcost()
+        self._hash = None
+        self._pos = None
             
     # Exchange mutation (called 'EM' by Larranaga et al).  Swaps node i with one
     # d links away (d = 1 means neighbor).  An optimization that has a big impact when
@@ -443,18 +1140,26 @@ class Tour:
     # link costs instead of recomputing full path length.  Notation:  path
     # through node i goes  xi - i - yi, and path through j is  xj - j - yj.
     
-    def mutate(self, i = None, distance = None):
+    def mutate(self, i = None, distance = None, near = None):
         """
         A call of the form t.mutate(i, d) modifies tour t by applying a "point mutation" 
         that swaps the city at location i in the tour with the city d locations away.  If 
         i is None a random location between 0 and n-1 is chosen.  If d is None it is set 
         to 1, i.e. the city at location i is exchanged with the one following it in the tour.
+        
+        A call of the form t.mutate(i, near = k) chooses one of the k cities closest to the 
+        city at location i and moves it to location i+1 (exchanging it with the city that 
+        was there), so the two neighbors are next to each other in the tour.
         """
         path = self._path
         n = len(path)
         
         if i == None:
             i = randint(0, n-1)
+        if near is not None:
+            a = self._matrix._candidates(near)[path[i]]
+            city = a[randint(0, len(a)-1)]
+            i, distance = (i + 1) % n, (self._locations()[city] - i - 1) % n
         if distance == None:  
             distance = 1 
         distance = distance % n
@@ -462,28 +1167,150 @@ class Tour:
             return
 
         j = (i + distance) % n      # will exchange path[i] with path[j]
+        self._cost += self._swap_delta(i, j)
+        if self._hash is None:
+            path[i], path[j] = path[j], path[i]
+        else:
+            links = {(i-1) % n, i, (j-1) % n, j}
+            h = self._hash ^ self._links_hash(links)
+            path[i], path[j] = path[j], path[i]
+            self._hash = h ^ self._links_hash(links)
+        if self._pos is not None:
+            self._pos[path[i]] = i
+            self._pos[path[j]] = j
         
-        xi = (i-1) % n              # locations before, after i
-        yi = (i+1) % n
-        xj = (j-1) % n              # locations before, after j
-        yj = (j+1) % n
+    # Change in cost from exchanging the cities at locations i and j.  If the cities are
+    # next to each other only two links change, otherwise four.  Every exchange in a tour
+    # of three cities leaves the cost unchanged.
         
-        if distance == 1:
-            self._cost -= self._matrix[ path[xi], path[i] ]
-            self._cost -= self._matrix[ path[j], path[yj] ]
-            self._cost += self._matrix[ path[xi], path[j] ]
-            self._cost += self._matrix[ path[i], path[yj] ]
-        else:
-            self._cost -= self._matrix[ path[xi], path[i] ]
-            self._cost -= self._matrix[ path[i], path[yi] ]
-            self._cost -= self._matrix[ path[xj], path[j] ]
-            self._cost -= self._matrix[ path[j], path[yj] ]
-            self._cost += self._matrix[ path[xi], path[j] ]
-            self._cost += self._matrix[ path[j], path[yi] ]
-            self._cost += self._matrix[ path[xj], path[i] ]
-            self._cost += self._matrix[ path[i], path[yj] ]
-            
-        path[i], path[j] = path[j], path[i]
+    def _swap_delta(self, i, j):
+        path = self._path
+        dist = self._matrix.distance
+        n = len(path)
+        if n <= 3:
+            return 0.0
+        if (i - j) % n == 1:
+            i, j = j, i
+        a, b = path[i], path[j]
+        xi, yj = path[(i-1) % n], path[(j+1) % n]
+        if (j - i) % n == 1:
+            return dist(xi, b) + dist(a, yj) - dist(xi, a) - dist(b, yj)
+        yi, xj = path[(i+1) % n], path[(j-1) % n]
+        return (dist(xi, b) + dist(b, yi) + dist(xj, a) + dist(a, yj) - 
+            dist(xi, a) - dist(a, yi) - dist(xj, b) - dist(b, yj))
+
+    # 2-opt move:  remove the links that leave locations i and j and reconnect the tour
+    # by reversing the part of the path between them.  The cost changes by the difference
+    # between the two links removed and the two links added, so it is updated in constant
+    # time (the reversal itself is linear in the length of the segment).
+    
+    def two_opt(self, i = None, j = None):
+        """
+        A call of the form t.two_opt(i, j) modifies tour t by removing the link from the city
+        at location i to its successor and the link from the city at location j to its 
+        successor, then reconnecting the tour by reversing the cities between them.  If i 
+        and j are not specified they are chosen at random.
+        """
+        n = len(self._path)
+        if n < 4:
+            return
+        if i == None or j == None:
+            i = randint(0, n-1)
+            j = (i + randint(2, n-2)) % n
+        if i > j:
+            i, j = j, i
+        if j - i < 2 or j - i > n - 2:
+            raise TSPError("two_opt: locations %d and %d are adjacent" % (i, j))
+        self._cost += self._two_opt_delta(i, j)
+        if self._hash is not None:
+            self._hash ^= self._links_hash((i, j))
+        self._path[i+1:j+1] = self._path[i+1:j+1][::-1]
+        if self._hash is not None:
+            self._hash ^= self._links_hash((i, j))
+        if self._pos is not None:
+            pos, path = self._pos, self._path
+            for k in range(i+1, j+1):
+                pos[path[k]] = k
+        
+    def _two_opt_delta(self, i, j):
+        path = self._path
+        dist = self._matrix.distance
+        n = len(path)
+        a, b = path[i], path[(i+1) % n]
+        c, d = path[j], path[(j+1) % n]
+        return dist(a, c) + dist(b, d) - dist(a, b) - dist(c, d)
+        
+    # Or-opt move:  cut out a segment of 1 to 3 cities and reinsert it somewhere else
+    # in the tour.  Three links are removed and three are added, so again the cost update
+    # takes constant time.
+    
+    def or_opt(self, i = None, size = None, j = None):
+        """
+        A call of the form t.or_opt(i, n, j) modifies tour t by moving the n cities that start 
+        at location i so they follow the city at location j.  Location j cannot be part of the
+        segment or the location just before it.  Arguments that are not specified are chosen
+        at random (n is between 1 and 3).  Note the new path may start with a different city
+        (tours are cycles, so this does not change the cost).
+        """
+        path = self._path
+        n = len(path)
+        if n < 4:
+            return
+        if i == None:
+            i = randint(0, n-1)
+        if size == None:
+            size = randint(1, min(3, n-3))
+        if j == None:
+            j = (i + size + randint(0, n-size-2)) % n
+        if not (size <= (j - i) % n <= n - 2):
+            raise TSPError("or_opt: can't move %d cities at %d to %d" % (size, i, j))
+        self._cost += self._or_opt_delta(i, size, j)
+        if self._hash is not None:
+            keys = self._matrix._link_keys()
+            prev, a = path[i-1], path[i]
+            z, nxt = path[(i + size - 1) % n], path[(i + size) % n]
+            c, d = path[j], path[(j+1) % n]
+            h = self._hash ^ self._links_hash(((i-1) % n, (i + size - 1) % n, j))
+            for (x, y) in ((prev, nxt), (c, a), (z, d)):
+                h ^= (keys[x] * keys[y]) & _mask64
+            self._hash = h
+        nxt = (i + size) % n
+        rest = [path[(nxt + k) % n] for k in range(n - size)]
+        segment = [path[(i + k) % n] for k in range(size)]
+        t = (j - nxt) % n + 1
+        self._path = array('i', rest[:t] + segment + rest[t:])
+        self._pos = None
+        
+    # Random moves for asearch.  Each method picks a random move of one kind and returns
+    # the change in cost and a function that makes the move.
+    
+    def _two_opt_move(self):
+        n = len(self._path)
+        i = randint(0, n-1)
+        j = (i + randint(2, n-2)) % n
+        return self._two_opt_delta(min(i, j), max(i, j)), lambda: self.two_opt(i, j)
+        
+    def _or_opt_move(self):
+        n = len(self._path)
+        i = randint(0, n-1)
+        size = randint(1, min(3, n-3))
+        j = (i + size + randint(0, n-size-2)) % n
+        return self._or_opt_delta(i, size, j), lambda: self.or_opt(i, size, j)
+        
+    def _mutate_move(self):
+        n = len(self._path)
+        i = randint(0, n-1)
+        d = randint(1, n-1)
+        return self._swap_delta(i, (i + d) % n), lambda: self.mutate(i, d)
+        
+    def _or_opt_delta(self, i, size, j):
+        path = self._path
+        dist = self._matrix.distance
+        n = len(path)
+        prev, a = path[i-1], path[i]
+        z, nxt = path[(i + size - 1) % n], path[(i + size) % n]
+        c, d = path[j], path[(j+1) % n]
+        return dist(prev, nxt) + dist(c, a) + dist(z, d) - dist(prev, a) - dist(z, nxt) - dist(c, d)
 
     def cross(self, other, i = None, size = None):
         """
@@ -494,28 +1321,362 @@ class Tour:
         caller they are chosen at random.
         """
         path = self._path
+        i, j = Tour._segment(len(path), i, size)
+        
+        if i < j:                           # keep one contiguous segment
+            p = path[i:j]
+        else:                               # segment wraps around, continues from 0
+            p = path[i:]
+            p += path[0:j]
+        
+        used = bytearray(self._matrix.size())   # used[x] is 1 if city x is in the new path
+        for city in p:
+            used[city] = 1
+        for city in other._path:
+            if not used[city]:
+                p.append(city)
+        self._path = p
+        
+        self._cost = self.pathcost()
+        self._hash = None
+        self._pos = None
+        
+    # Partially mapped crossover (PMX).  The segment from this tour stays in place; each
+    # remaining location gets the city from the same location in the other tour, unless
+    # that city is already in the segment.  In that case follow the mapping defined by
+    # the segment (city in this tour -> city at the same location in the other tour) 
+    # until reaching a city that is not in the segment.
+    
+    def pmx(self, other, i = None, size = None):
+        """
+        A call of the form t.pmx(other, i, n) mutates tour t by applying a "partially mapped"
+        cross-over with another tour.  The n cities starting at location i in tour t stay
+        where they are, and the remaining locations are filled with cities from the other 
+        tour, keeping as many of them in their original locations as possible.  If i and n
+        are not specified by the caller they are chosen at random.
+        """
+        path = self._path
         n = len(path)
+        i, j = Tour._segment(n, i, size)
         
+        child = array('i', other._path)
+        loc = { }                           # location of each segment city in this tour
+        k = i
+        while True:                         # if i == j the segment is the whole tour
+            child[k] = path[k]
+            loc[path[k]] = k
+            k = (k + 1) % n
+            if k == j:  break
+        while k != i:
+            city = other._path[k]
+            while city in loc:
+                city = other._path[loc[city]]
+            child[k] = city
+            k = (k + 1) % n
+        self._path = child
+        
+        self._cost = self.pathcost()
+        self._hash = None
+        self._pos = None
+        
+    # Helper for the cross-over methods:  return the start and end (one past the last item) 
+    # of the segment to keep, choosing them at random if they are not specified.
+    
+    @staticmethod
+    def _segment(n, i, size):
         if i == None:                       # i is the starting index of the segment to keep
             i = randint(0, n-1)
         if size == None:                    # set j to one past the last item to keep
             j = i + randint(2,n//2)
         else:
             j = i + size
-        j = j % n
+        return i, j % n
+
+# Local search
+
+def local_search(tour, max_iters = None, k = 8):
+    """
+    [TSPLab] Improve a tour by making 2-opt and Or-opt moves that lower its cost, stopping 
+    when no more improving moves can be found or after max_iters moves.  To save time the 
+    only moves considered are ones that add a link from a city to one of its k nearest 
+    neighbors.  The tour is modified in place; the return value is the tour.  The tour
+    has to include every city in the map.
+    """
+    m = tour._matrix
+    _check_full_tour(tour)
+    n = len(tour._path)
+    if n < 4:
+        return tour
+    dist = m.distance
+    near = m._candidates(k)
+    moves = 0
+    improved = True
+    while improved:
+        improved = False
+        path = tour._path
+        pos = _positions(path)
         
-        if i < j:                           # keep one contiguous segment
-            p = self._path[i:j]
-        else:                               # segment wraps around, continues from 0
-            p = self._path[i:]
-            p += self._path[0:j]
+        # 2-opt:  link a to c, where c is closer to a than a's neighbor b.  When b is
+        # a's successor the other link removed is from c to its successor, when b is
+        # a's predecessor it is from c to its predecessor (an improving move makes at
+        # least one of its two new links shorter than a link it removes, so trying
+        # both neighbors finds every improving move among the candidates)
         
-        self._path = p
-        for city in other._path:
-            if city not in self._path:
-                self._path.append(city)
+        for i in range(n):
+            for side in (1, -1):
+                a = path[i]
+                b = path[(i + side) % n]
+                dab = dist(a, b)
+                done = moves
+                for c in near[a]:
+                    dac = dist(a, c)
+                    if dac >= dab:  break
+                    j = pos[c]
+                    d = path[(j + side) % n]
+                    if c == b or d == a:  continue
+                    if dac + dist(b, d) - dab - dist(c, d) < -1e-9:
+                        p, q = (i, j) if side == 1 else ((i-1) % n, (j-1) % n)
+                        tour.two_opt(p, q)
+                        for x in range(min(p, q)+1, max(p, q)+1):
+                            pos[path[x]] = x
+                        moves += 1
+                        improved = True
+                        break
+                if moves > done:  break
+            if max_iters is not None and moves >= max_iters:
+                return tour
         
-        self._cost = self.pathcost()
+        # Or-opt:  move a segment starting with a so that it follows c (with 4 cities
+        # every Or-opt move is also a 2-opt move)
+        
+        for i in range(n if n > 4 else 0):
+            for size in range(1, min(3, n-3) + 1):
+                prev, a = path[i-1], path[i]
+                z, nxt = path[(i + size - 1) % n], path[(i + size) % n]
+                gain = dist(prev, a) + dist(z, nxt) - dist(prev, nxt)
+                for c in near[a]:
+                    dca = dist(c, a)
+                    if dca >= gain:  break
+                    j = pos[c]
+                    if not (size <= (j - i) % n <= n - 2):  continue
+                    d = path[(j+1) % n]
+                    if dca + dist(z, d) - dist(c, d) - gain < -1e-9:
+                        tour.or_opt(i, size, j)
+                        path = tour._path
+                        pos = _positions(path)
+                        moves += 1
+                        improved = True
+                        break
+                if max_iters is not None and moves >= max_iters:
+                    return tour
+    return tour
+
+# The local search operators keep an array with the location of each city, so they 
+# only work on tours that include every city in the map.
+
+def _check_full_tour(tour):
+    if len(tour._path) != tour._matrix.size():
+        raise TSPError("tour has %d cities but the map has %d" % (len(tour._path), tour._matrix.size()))
+
+def _positions(path):
+    pos = [0] * len(path)
+    for (i, city) in enumerate(path):
+        pos[city] = i
+    return pos
+
+# Simulated annealing
+
+_asearch_options = {
+    'start' : 'random',
+    'move' : 'two_opt',
+    'schedule' : 'exponential',
+    't0' : None,
+    'tmin' : None,
+    'observer' : None,
+    'interval' : 1000,
+}
+
+_asearch_moves = ('two_opt', 'or_opt', 'mutate')
+_asearch_schedules = ('exponential', 'linear', 'logarithmic')
+
+def asearch(m, maxiter, **user_options):
+    """
+    [TSPLab] Use simulated annealing to search for the optimal tour of the cities on map m.
+    Starting from a single tour, each of the maxiter iterations makes a random change and 
+    computes the difference in cost.  A change that lowers the cost is always kept; one
+    that raises the cost by d is kept with probability exp(-d/T), where the "temperature"
+    T is lowered as the search goes on.  The return value is the lowest cost tour found.
+    
+    Options and their defaults are:
+        start :     'random'       the kind of tour to start with (see Map.make_tour) or
+                                   a Tour object (which is not modified)
+        move :      'two_opt'      the type of change, 'two_opt', 'or_opt', or 'mutate'
+        schedule :  'exponential'  how the temperature goes from t0 to tmin:  'exponential',
+                                   'linear', 'logarithmic', or a function f(k, maxiter, t0, tmin)
+                                   that returns the temperature for iteration k
+        t0 :        None           starting temperature (default: set so about half the
+                                   changes that raise the cost are accepted at first)
+        tmin :      None           final temperature (default: t0 / 1000)
+        observer :  None           a function to call with a Progress object every interval 
+        interval :  1000           iterations; the median attribute is the cost of the
+                                   current tour and survivors is the number of changes kept
+    The search does not update the canvas.
+    """
+    options = dict(_asearch_options)
+    options.update(user_options)
+    if options['move'] not in _asearch_moves:
+        raise TSPError("move must be one of %s" % str(_asearch_moves))
+    schedule = options['schedule']
+    if not callable(schedule) and schedule not in _asearch_schedules:
+        raise TSPError("schedule must be a function or one of %s" % str(_asearch_schedules))
+    
+    Tour.reset()
+    tour = _start_tour(m, options['start'])
+    n = m.size()
+    if n < 5 or maxiter < 1:
+        return tour
+    move = getattr(tour, '_%s_move' % options['move'])
+    t0 = options['t0'] or _initial_temperature(tour, move)
+    tmin = options['tmin'] or t0 / 1000
+    if schedule == 'exponential':
+        alpha = (tmin / t0) ** (1 / maxiter)
+    observer = options['observer']
+    interval = options['interval']
+    
+    best = None                         # a copy of the best tour, made only when needed
+    bestcost = tour.cost()
+    accepted = 0
+    temp = t0
+    start = perf_counter()
+    for k in range(maxiter):
+        if schedule == 'exponential':
+            temp *= alpha
+        elif schedule == 'linear':
+            temp = t0 - (t0 - tmin) * k / maxiter
+        elif schedule == 'logarithmic':
+            temp = max(tmin, t0 / log(k + 2, 2))
+        else:
+            temp = schedule(k, maxiter, t0, tmin)
+        delta, apply = move()
+        if delta <= 0 or random() < exp(-delta / temp):
+            if delta > 0 and best is None:
+                best = tour.clone()
+            apply()
+            accepted += 1
+            if tour.cost() < bestcost - 1e-9:
+                bestcost = tour.cost()
+                best = None
+        if observer and ((k+1) % interval == 0 or k+1 == maxiter):
+            observer(Progress(k+1, bestcost, tour.cost(), accepted, perf_counter() - start))
+    
+    return tour if best is None else best
+
+# Make the tour a local search starts from.
+
+def _start_tour(m, start):
+    if isinstance(start, Tour):
+        _check_full_tour(start)
+        return start.clone()
+    return m.make_tour(start)
+
+# Set the starting temperature so a change that raises the cost by the average amount 
+# (estimated from a sample of random changes) is accepted half the time.
+
+def _initial_temperature(tour, move, samples = 100):
+    ups = [d for d in (move()[0] for i in range(samples)) if d > 0]
+    if len(ups) == 0:
+        return 1.0
+    return (fsum(ups) / len(ups)) / log(2)
+
+# Tabu search
+
+_tsearch_options = {
+    'start' : 'nearest',
+    'tenure' : 10,
+    'neighbors' : 8,
+    'sample' : None,
+    'observer' : None,
+    'interval' : 100,
+}
+
+def tsearch(m, maxiter, **user_options):
+    """
+    [TSPLab] Use tabu search to find a low cost tour of the cities on map m.  Each of the
+    maxiter iterations makes the best 2-opt move that adds a link from a city to one of 
+    its nearest neighbors, even if the move raises the cost.  To keep the search from
+    undoing its recent moves, the links removed by a move are "tabu" and can't be added
+    back for the next few iterations, unless that would make a new lowest cost tour.  The
+    return value is the lowest cost tour found.
+    
+    Options and their defaults are:
+        start :     'nearest'      the kind of tour to start with (see Map.make_tour) or
+                                   a Tour object (which is not modified)
+        tenure :    10             number of iterations a removed link stays tabu
+        neighbors : 8              number of nearest neighbors to try for each city
+        sample :    None           if an integer, only try moves from this many randomly
+                                   chosen cities in each iteration (default: all cities)
+        observer :  None           a function to call with a Progress object every interval 
+        interval :  100            iterations; the median attribute is the cost of the 
+                                   current tour and survivors is the number of moves made
+    The search does not update the canvas.
+    """
+    options = dict(_tsearch_options)
+    options.update(user_options)
+    
+    Tour.reset()
+    tour = _start_tour(m, options['start'])
+    n = m.size()
+    if n < 5:
+        return tour
+    dist = m.distance
+    near = m._candidates(options['neighbors'])
+    tenure = options['tenure']
+    sample = options['sample']
+    observer = options['observer']
+    interval = options['interval']
+    
+    tabu = { }                          # link key -> first iteration it can be added again
+    best = tour.clone()
+    moves = 0
+    start = perf_counter()
+    path = tour._path
+    pos = _positions(path)
+    for k in range(maxiter):
+        move = None
+        mindelta = None
+        cities = range(n) if sample is None else [randint(0, n-1) for x in range(sample)]
+        for i in cities:
+            a, b = path[i], path[(i+1) % n]
+            dab = dist(a, b)
+            for c in near[a]:
+                j = pos[c]
+                d = path[(j+1) % n]
+                if c == b or d == a:  continue
+                delta = dist(a, c) + dist(b, d) - dab - dist(c, d)
+                if mindelta is not None and delta >= mindelta:  continue
+                if tabu.get(_link(a, c, n), 0) > k or tabu.get(_link(b, d, n), 0) > k:
+                    if tour.cost() + delta >= best.cost() - 1e-9:  continue
+                move, mindelta = (i, j, a, b, c, d), delta
+        if move is None:
+            break
+        i, j, a, b, c, d = move
+        tour.two_opt(i, j)
+        for x in range(min(i, j) + 1, max(i, j) + 1):
+            pos[path[x]] = x
+        tabu[_link(a, b, n)] = k + 1 + tenure
+        tabu[_link(c, d, n)] = k + 1 + tenure
+        moves += 1
+        if tour.cost() < best.cost() - 1e-9:
+            best = tour.clone()
+        if observer and ((k+1) % interval == 0 or k+1 == maxiter):
+            observer(Progress(k+1, best.cost(), tour.cost(), moves, perf_counter() - start))
+    
+    return best
+
+# Key for the link between cities a and b, the same in both directions.
+
+def _link(a, b, n):
+    return a * n + b if a < b else b * n + a
 
 # Exhaustive search
 
@@ -525,16 +1686,174 @@ def xsearch(m):
     returning the tour object that has the lowest cost path.
     """
     best = m.make_tour()
-    for t in m.each_tour():
-        if t.cost() < best.cost():
-            best = t
+    bestcost = best.cost()
+    bestpath = None
+    for (cost, path) in m.each_tour(fast = True):
+        if cost < bestcost:
+            bestcost = cost
+            bestpath = array('i', path)
+    if bestpath is not None:
+        best = Tour._from_indices(m, bestpath)
     return best
     
+# Exact search without enumerating every tour.  Small maps are solved by dynamic
+# programming (the Held-Karp algorithm), larger ones by branch and bound.
+
+_bsearch_options = {
+    'dpmax' : 12 if np is None else 20,
+    'restarts' : 5,
+}
+
+def bsearch(m, **user_options):
+    """
+    [TSPLab] Find the lowest cost tour of the cities in map m, without generating every
+    possible tour.  The result is the same as the tour found by xsearch (if two or more 
+    tours have the same lowest cost it may be a different one of those tours).  The
+    options and their defaults are:
+        dpmax :     20             use dynamic programming (the Held-Karp algorithm) for 
+                                   maps with up to this many cities (12 without NumPy)
+        restarts :  5              number of local searches used to find a starting 
+                                   upper bound for branch and bound
+    For larger maps bsearch uses branch and bound:  it builds tours one city at a time,
+    abandoning a partial tour as soon as its cost plus the cost of a minimal spanning
+    tree connecting the remaining cities is more than the best complete tour seen so far.
+    """
+    options = dict(_bsearch_options)
+    options.update(user_options)
+    
+    if m.size() < 4:
+        return m.make_tour()
+    if m.size() <= options['dpmax']:
+        if np is None:
+            path = _held_karp(m)
+        else:
+            path = _np_held_karp(m)
+    else:
+        path = _branch_and_bound(m, options['restarts'])
+    return Tour._from_indices(m, _canonical(path))
+
+# Rotate a path so it starts with city 0, and reverse it if necessary so city 1 comes
+# before city 2, which is the orientation of tours generated by each_tour.
+
+def _canonical(path):
+    path = list(path)
+    k = path.index(0)
+    path = path[k:] + path[:k]
+    if path.index(1) > path.index(2):
+        path[1:] = reversed(path[1:])
+    return array('i', path)
+
+# Held-Karp:  cost[s][j] is the cost of the shortest path that starts at city 0, visits
+# every city in the set s, and ends at city j (a member of s).  Sets are bit vectors 
+# where bit j-1 stands for city j.  After filling in the table, trace the path backward 
+# from the cheapest way to return to city 0.
+
+def _held_karp(m):
+    n = m.size() - 1
+    dist = m.distance
+    inf = float('inf')
+    cost = [[inf] * n for s in range(1 << n)]
+    for j in range(n):
+        cost[1 << j][j] = dist(0, j+1)
+    for s in range(1, 1 << n):
+        for j in range(n):
+            if s & (1 << j) == 0 or s == 1 << j:  continue
+            prev = cost[s ^ (1 << j)]
+            cost[s][j] = min([prev[k] + dist(k+1, j+1) for k in range(n)])
+    return _held_karp_path(n, lambda s, j: [cost[s][k] + dist(k+1, j+1) for k in range(n)], [cost[-1][j] + dist(j+1, 0) for j in range(n)])
+
+def _held_karp_path(n, links, ends):
+    j = ends.index(min(ends))
+    s = (1 << n) - 1
+    path = [j+1]
+    while s != 1 << j:
+        s ^= 1 << j
+        a = links(s, j)
+        j = a.index(min(a))
+        path.append(j+1)
+    path.append(0)
+    path.reverse()
+    return path
+
+# The same algorithm, with each row of the table a NumPy vector.  Sets are processed in
+# order of size, and all sets of the same size are handled in a single operation.
+
+def _np_held_karp(m):
+    n = m.size() - 1
+    D = m._np_matrix()
+    links = D[1:, 1:]
+    cost = np.full((1 << n, n), np.inf)
+    sets = np.arange(1 << n)
+    size = np.zeros(1 << n, dtype=int)
+    for j in range(n):
+        size += (sets >> j) & 1
+        cost[1 << j, j] = D[0, j+1]
+    for k in range(2, n+1):
+        layer = sets[size == k]
+        for j in range(n):
+            s = layer[(layer >> j) & 1 == 1]
+            cost[s, j] = (cost[s ^ (1 << j)] + links[:, j]).min(axis=1)
+    return _held_karp_path(n, lambda s, j: list(cost[s] + links[:, j]), list(cost[-1] + D[1:, 0]))
+
+# Branch and bound.  The first upper bound comes from running local search on a few 
+# random tours.  Partial tours are extended with the closest cities first so good
+# complete tours (which lower the bound) are found early.
+
+def _branch_and_bound(m, restarts):
+    n = m.size()
+    dist = m.distance
+    best = min([local_search(m.make_tour('random')) for i in range(max(1, restarts))], key = Tour.cost)
+    state = { 'bound' : best.cost(), 'path' : list(best._path) }
+    path = [0]
+    visited = bytearray(n)
+    visited[0] = 1
+    
+    def extend(cost):
+        last = path[-1]
+        if len(path) == n:
+            if cost + dist(last, 0) < state['bound'] - 1e-9:
+                state['bound'] = cost + dist(last, 0)
+                state['path'] = list(path)
+            return
+        rest = [c for c in range(n) if not visited[c]]
+        if cost + _mst_cost(m, rest + [last, 0] if last != 0 else rest + [0]) >= state['bound'] - 1e-9:
+            return
+        for c in sorted(rest, key = lambda c: dist(last, c)):
+            visited[c] = 1
+            path.append(c)
+            extend(cost + dist(last, c))
+            path.pop()
+            visited[c] = 0
+    
+    extend(0.0)
+    return state['path']
+
+# Cost of a minimal spanning tree connecting the cities in list a (Prim's algorithm).
+
+def _mst_cost(m, a):
+    dist = m.distance
+    inf = float('inf')
+    key = { c : dist(a[0], c) for c in a[1:] }
+    total = 0.0
+    while key:
+        c = min(key, key = key.get)
+        total += key.pop(c)
+        for x in key:
+            d = dist(c, x)
+            if d < key[x]:
+                key[x] = d
+    return total
+
 # Random Search
 
 _rsearch_options = {
     'update' : 10,
     'pause' : 0,
+    'top' : 1,
+    'backend' : 'python',
+    'batch' : None,
+    'workers' : 1,
+    'seed' : None,
 }
 
 def rsearch(m, n, **user_options):
@@ -544,13 +1863,39 @@ def rsearch(m, n, **user_options):
     control how the display is updated when the map is on the canvas:
         update (default 10) is the number of iterations to perform between updates 
         pause (default 0) is the time (in seconds) to pause between updates
+    Pass top = k to get a list of the k lowest cost tours (sorted by cost) instead of 
+    a single tour.  With top = 1 (the default) the return value is a Tour, not a list.
+    
+    If the backend option is 'numpy' (which requires NumPy) the tours are made in
+    batches, as rows of a 2-D array, and only the best k are turned into Tour objects.
+    Options for the numpy backend are:
+        batch :     None           number of tours in each batch (default: about one
+                                   million cities per batch)
+        workers :   1              number of processes (None means one per CPU)
+        seed :      None           an integer to make the search repeatable; the
+                                   result does not depend on the number of workers
+    The numpy backend does not update the canvas, and the batch, workers, and seed
+    options can only be used with the numpy backend.
     """
     options = dict(_rsearch_options)
     options.update(user_options)
     
+    if options['backend'] not in ('python', 'numpy'):
+        raise TSPError("backend must be 'python' or 'numpy'")
+    if type(options['top']) != int or options['top'] < 1:
+        raise TSPError("top must be a positive integer")
+    if options['backend'] == 'numpy':
+        if np is None:
+            raise TSPError("the numpy backend requires the NumPy package")
+        return _np_rsearch(m, n, options)
+    if options['batch'] is not None or options['workers'] != 1 or options['seed'] is not None:
+        raise TSPError("the batch, workers, and seed options require the numpy backend")
+    
     Tour.reset()                        # set tour counter to 0
     
     best = m.make_tour('random')
+    top = [(-best.cost(), 0, best)]     # the k best tours, as a heap with the worst on top
+    k = options['top']
     if Canvas.view:  
         init_tour_display(best, { 'ntours' : "#tours: 0", 'cost' : "cost:" }, [])
         Canvas.view.options['update'] = options['update']
@@ -560,11 +1905,49 @@ def rsearch(m, n, **user_options):
         t = m.make_tour('random')
         if t.cost() < best.cost():
             best = t
+        if k > 1:
+            if len(top) < k:
+                heappush(top, (-t.cost(), i+1, t))
+            elif t.cost() < -top[0][0]:
+                heapreplace(top, (-t.cost(), i+1, t))
         if Canvas.view:
             _update_tour_display(t, i)
     
+    if k > 1:
+        return [t for (c, i, t) in sorted(top, reverse = True)]
     return best
     
+# Batched random search.  The tours are split into blocks that are made by separate
+# calls to _rsearch_block, either in this process or in a pool of worker processes.  Each
+# block has its own random number generator, seeded from the seed option and the block
+# number, and returns its k best (cost, path) pairs.
+
+def _np_rsearch(m, n, options):
+    n = max(n, 1)                       # like the Python version, always make at least one tour
+    k = options['top']
+    base = options['seed'] if options['seed'] is not None else getrandbits(32)
+    rows = options['batch'] or max(1, 2**20 // m.size())
+    counts = [min(rows, n - s) for s in range(0, n, rows)]
+    keys = [(base, b) for b in range(len(counts))]
+    if options['workers'] == 1:
+        results = [_rsearch_block(count, k, key, m) for (count, key) in zip(counts, keys)]
+    else:
+        with ProcessPoolExecutor(options['workers'], initializer = _init_island, initargs = (m,)) as pool:
+            results = list(pool.map(_rsearch_block, counts, [k] * len(counts), keys))
+    Tour.reset()
+    best = nsmallest(k, [x for block in results for x in block], key = lambda x: x[0])
+    tours = [Tour._from_indices(m, path, cost) for (cost, path) in best]
+    return tours if k > 1 else tours[0]
+
+def _rsearch_block(count, k, key, m = None):
+    if m is None:
+        m = _island_map
+    rng = np.random.default_rng(key)
+    P = np.argsort(rng.random((count, m.size())), axis=1).astype(np.int32)
+    C = _np_pathcost(m._np_matrix(), P)
+    best = np.argpartition(C, k-1)[:k] if count > k else range(count)
+    return [(float(C[i]), array('i', P[i].tolist())) for i in best]
+    
 # Genetic algorithm (aka "evolutionary search")
     
 _esearch_options = {
@@ -575,9 +1958,22 @@ _esearch_options = {
         'all_small' : (1.0, 0.0, 0.0),
         'all_large' : (0.0, 1.0, 0.0),
         'all_cross' : (0.0, 0.0, 1.0),
+        'all_2opt'  : (0.0, 0.0, 0.0, 1.0, 0.0),
+        'all_oropt' : (0.0, 0.0, 0.0, 0.0, 1.0),
     }, 
     'dist' : 'all_small',
+    'crossover' : 'cross',
+    'selection' : 'classic',
+    'tsize' : 2,
+    'dedup' : False,
+    'seeding' : None,
+    'neighbors' : None,
     'resume' : False,
+    'backend' : 'python',
+    'observer' : None,
+    'interval' : 1,
+    'checkpoint' : None,
+    'checkpoint_every' : 1000,
     'update' : 1, 
     'pause' : 0.02,
 }
@@ -597,29 +1993,92 @@ def esearch(m, maxgen, popsize, **user_options):
     options and their defaults are:
         popsize :   10             population size
         dist :      'all_small'    mutation probability distribution (see note below)
+        crossover : 'cross'        type of cross-over, either 'cross' (order cross-over)
+                                   or 'pmx' (partially mapped cross-over)
+        selection : 'classic'      how survivors are chosen (see select_survivors)
+        tsize :     2              number of tours in each tournament
+        dedup :     False          if true, don't add a new tour that has the same links
+                                   as a tour already in the population (see below)
+        seeding :   None           a dictionary with the fraction of the initial population
+                                   to make with each kind of tour construction (see below)
+        neighbors : None           if an integer k, small point mutations move a city next
+                                   to one of its k nearest neighbors (see Tour.mutate)
         pause :     0.02           time (in seconds) to pause between each generation
-        resume :    False          if true resume a previous search
+        resume :    False          if true resume a previous search, if a file name
+                                   resume the search saved in that checkpoint file
+        backend :   'python'       'python' or 'numpy' (see note below)
+        observer :  None           a function to call with a Progress object (see below)
+        interval :  1              number of generations between calls to the observer
+        checkpoint : None          name of a file to save the state of the search in
+        checkpoint_every : 1000    number of generations between checkpoints
     
     The distribution option is passed to the rebuild_population function to tell it which
     types of mutations to perform when creating new tours.  It can either be a list (or 
     tuple) of three numbers that sum to 1.0 or a string that corresponds to the name of
     a predefined distribution.  The three numbers are the probability of a nearby point
-    mutation, a long distance point mutation, or a crossover.  The predefined distributions
-    are:
+    mutation, a long distance point mutation, or a crossover.  Two more numbers can be
+    added to the list, the probabilities of a random 2-opt move and a random Or-opt
+    move.  The predefined distributions are:
         all_small  : (1.0, 0.0, 0.0)
         all_large  : (0.0, 1.0, 0.0)
         all_cross  : (0.0, 0.0, 1.0)
+        all_2opt   : (0.0, 0.0, 0.0, 1.0, 0.0)
+        all_oropt  : (0.0, 0.0, 0.0, 0.0, 1.0)
         mixed      : (0.5, 0.25, 0.25)
+        
+    By default every tour in the initial population is random.  The seeding option
+    can specify other kinds of tours, e.g. {'nearest' : 0.1, 'greedy' : 0.05} makes 10%
+    of the population nearest neighbor tours (each starting from a random city) and 5%
+    mutated copies of a greedy edge tour.  The rest of the tours are random.
+        
+    The 'numpy' backend (which requires NumPy) keeps the population in a single 2-D
+    array of city indices, with one row per tour, and applies selection and mutations 
+    to all rows at once.  It is much faster for large populations, but it does not 
+    update the canvas while it runs.  The return value is a Tour in either case.
+    
+    To follow the progress of a search without the canvas pass a function as the
+    observer option.  It will be called every interval generations (and after the last
+    generation) with a Progress object that has the generation number, the costs of
+    the best and median tours, the number of survivors, and the elapsed time, e.g.
+        esearch(m, 1000, 100, observer = print, interval = 100)
+    The observer is also called each time a checkpoint is saved.
+    
+    Small mutations often make tours that are already in the population, which wastes
+    time and makes the population less diverse.  With dedup = True each new tour is
+    compared (using Tour.edge_hash) to the tours already in the population, and a 
+    duplicate is replaced by another new tour (up to 3 tries).
+    
+    A long search can be saved to a file as it runs by passing a file name as the 
+    checkpoint option.  The file has the population, the generation number, the options,
+    and the state of the random number generator, and it is replaced every 
+    checkpoint_every generations and at the end of the search.  To continue the search
+    (e.g. in a new Python session) call esearch with the same map, the new maximum
+    number of generations, and the file name as the resume option:
+        esearch(m, 10000, 100, checkpoint = 'run.ckpt')
+        esearch(m, 20000, 100, resume = 'run.ckpt')
     """
     global previous_population, previous_options, previous_maxgen
     
     options = dict(_esearch_options)
     options.update(user_options)
     
-    if options['resume']:
+    if options['backend'] not in ('python', 'numpy'):
+        raise TSPError("backend must be 'python' or 'numpy'")
+    if options['backend'] == 'numpy' and np is None:
+        raise TSPError("the numpy backend requires the NumPy package")
+    
+    if isinstance(options['resume'], str):
+        population, ngen, options = _load_checkpoint(options['resume'], m)
+        for key in _resume_overrides:
+            if key in user_options:
+                options[key] = user_options[key]
+    elif options['resume']:
         if previous_population:
             population = previous_population
-            options = previous_options
+            options = dict(previous_options)
+            for key in _resume_overrides:
+                if key in user_options:
+                    options[key] = user_options[key]
             ngen = previous_maxgen
         else:
             raise TSPError("no previous population")
@@ -627,37 +2086,126 @@ def esearch(m, maxgen, popsize, **user_options):
         _check_mutation_parameters(options)
         Tour.reset()
         # population = init_population(m, popsize = options['popsize'])
-        population = init_population(m, popsize)
+        if options['backend'] == 'numpy':
+            population = _seed_tours(m, popsize, options['seeding'])
+        else:
+            population = init_population(m, popsize, options['seeding'])
         ngen = 0
         if Canvas.view:
             Canvas.view.options['update'] = options['update']
             Canvas.delay = options['pause']
     
-    dist = options['dist']
-    probs = options['profiles'][dist]
-    sdmax = 1 if m.size() < 10 else m.size() // 10           # max distance for small point mutation
-    ldmax = 1 if m.size() < 10 else m.size() // 4            # and for large point mutation
+    dist = _mutation_distribution(m, options)
+    if options['backend'] == 'numpy' and (fsum(dist['probs'][3:]) > 0 or dist['cross'] != 'cross' or dist['near'] or dist['selection'] != 'classic' or dist['dedup']):
+        raise TSPError("the numpy backend does only point mutations, order cross-overs, and classic selection without dedup")
 
-    evolve(population, m, ngen, maxgen, {'sdmax' : sdmax, 'ldmax' : ldmax, 'probs': probs})
+    start = perf_counter()
+    while True:
+        stop = min(maxgen, ngen + options['checkpoint_every']) if options['checkpoint'] else maxgen
+        if options['backend'] == 'numpy':
+            population = _np_esearch(m, population, popsize, ngen, stop, dist, options['observer'], options['interval'], start)
+        else:
+            evolve(population, m, ngen, stop, dist, options['observer'], options['interval'], start)
+        ngen = max(ngen, stop)
+        if options['checkpoint']:
+            _save_checkpoint(options['checkpoint'], m, population, ngen, options)
+        if ngen >= maxgen:
+            break
 
     previous_population = population
     previous_options = options
     previous_maxgen = maxgen
     
-    return population[0]
+    return min(population, key = Tour.cost)
    
+# Options that can be changed when a search is resumed; the others are restored from
+# the previous search.
+
+_resume_overrides = ('observer', 'interval', 'checkpoint', 'checkpoint_every')
+
+# A checkpoint file is a pickled dictionary.  The paths of all the tours are stored 
+# in a single array of integers and the costs in an array of doubles, so the file is
+# about 4 bytes per city per tour.  The observer is not saved (functions can't always
+# be pickled).  The file is written under a temporary name and then renamed, so if the
+# process is stopped while it is writing the previous checkpoint is still there.
+
+_checkpoint_version = 1
+
+def _save_checkpoint(filename, m, population, gen, options):
+    paths = array('i')
+    for t in population:
+        paths.extend(t._path)
+    state = {
+        'version' : _checkpoint_version,
+        'cities' : m.cities(),
+        'gen' : gen,
+        'paths' : paths.tobytes(),
+        'costs' : array('d', [t.cost() for t in population]).tobytes(),
+        'options' : {k : v for (k, v) in options.items() if k not in ('observer', 'resume')},
+        'random' : getstate(),
+        'count' : Tour._count,
+    }
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, filename)
+    
+def _load_checkpoint(filename, m):
+    try:
+        with open(filename, 'rb') as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError) as err:
+        raise TSPError("can't read checkpoint file %s: %s" % (filename, err))
+    if type(state) != dict or state.get('version') != _checkpoint_version:
+        raise TSPError("%s is not a checkpoint file" % filename)
+    if state['cities'] != m.cities():
+        raise TSPError("checkpoint file %s is for a different map" % filename)
+    paths = array('i')
+    paths.frombytes(state['paths'])
+    costs = array('d')
+    costs.frombytes(state['costs'])
+    n = m.size()
+    population = [Tour._from_indices(m, paths[k*n:(k+1)*n], costs[k]) for k in range(len(costs))]
+    options = dict(_esearch_options)
+    options.update(state['options'])
+    setstate(state['random'])
+    Tour._count = state['count']
+    return population, state['gen'], options
+    
+# Helper function called from esearch and isearch to make the dictionary that tells
+# rebuild_population how to make new tours
+
+def _mutation_distribution(m, options):
+    probs = options['profiles'][options['dist']]
+    sdmax = 1 if m.size() < 10 else m.size() // 10           # max distance for small point mutation
+    ldmax = 1 if m.size() < 10 else m.size() // 4            # and for large point mutation
+    return {'sdmax' : sdmax, 'ldmax' : ldmax, 'probs': probs, 'cross' : options['crossover'], 'near' : options['neighbors'],
+        'selection' : options['selection'], 'tsize' : options['tsize'], 'dedup' : options['dedup']}
+
 # Helper function called from esearch to validate search parameters
  
 def _check_mutation_parameters(options):
     dist = options['dist']
     profiles = options['profiles']
-    float_error = "distribution must be an array of three numbers between 0.0 and 1.0"
+    float_error = "distribution must be an array of three or five numbers between 0.0 and 1.0"
     dist_name_error = "distribution must be one of %s" % [k for k in profiles.keys()]
+    if options['crossover'] not in ('cross', 'pmx'):
+        raise TSPError("crossover must be 'cross' or 'pmx'")
+    if options['selection'] not in _selection_methods:
+        raise TSPError("selection must be one of %s" % str(_selection_methods))
+    if type(options['tsize']) != int or options['tsize'] < 1:
+        raise TSPError("tsize must be a positive integer")
+    seeding = options.get('seeding') or { }
+    for kind in seeding:
+        if kind not in _seed_kinds:
+            raise TSPError("seeding kinds must be in %s" % str(_seed_kinds))
+    if fsum(seeding.values()) > 1.0:
+        raise TSPError("seeding fractions must add up to at most 1.0")
     if type(dist) == str:
         if options['dist'] not in profiles:
             raise TSPError(dist_name_error)
     elif type(dist) == list or type(dist) == tuple:
-        if len(dist) != 3:
+        if len(dist) not in (3, 5):
             raise TSPError(float_error)
         total = fsum(dist)
         if total != 1.0:
@@ -667,21 +2215,71 @@ def _check_mutation_parameters(options):
     else:
         raise TSPError(float_error + " or " + dist_name_error)
     
-def init_population(m, popsize):
+def init_population(m, popsize, seeding = None):
     """
     [TSPLab] Create a list of random tours of the cities in map m.  The popsize
-    parameter specifies the number of tours.
+    parameter specifies the number of tours.  The optional seeding parameter is a 
+    dictionary that maps a kind of tour to make (see Map.make_tour) to the fraction of
+    the population that should be made that way; the remaining tours are random.
     """
-    pop = [m.make_tour('random') for i in range(popsize)]
+    pop = _seed_tours(m, popsize, seeding)
+    pop += [m.make_tour('random') for i in range(popsize - len(pop))]
     if Canvas.view:
         init_tour_display(pop[0], { 'ngen' : "generations: 0", 'ntours' : "#tours: 0", 'cost' : "cost:" }, pop)
         Canvas.update()
     return pop
     
+# Make the non-random tours for an initial population.  Nearest neighbor tours start 
+# from random cities; the other kinds always make the same tour, so the first one is 
+# kept and the rest are mutated copies.
+
+_seed_kinds = ('nearest', 'greedy', 'christofides-lite')
+
+def _seed_tours(m, popsize, seeding):
+    pop = []
+    for (kind, fraction) in (seeding or { }).items():
+        count = int(fraction * popsize)
+        if count == 0:  continue
+        if kind == 'nearest':
+            pop += [m.make_tour('nearest', start = m.label(randint(0, m.size()-1))) for i in range(count)]
+        else:
+            base = m.make_tour(kind)
+            pop += [base] + [m.make_tour('mutate', base) for i in range(count-1)]
+    return pop
+
+class Progress:
+    """
+    [TSPLab] A Progress object is passed to the observer function of a search to report 
+    how far the search has gone.  The attributes are gen (the number of generations, or 
+    iterations, completed), best and median (the costs of the best and median tours in
+    the current population), survivors (the number of tours that survived the last 
+    round of selection), and elapsed (seconds since the search started).  Searches that 
+    work on a single tour (asearch, tsearch) report the cost of the current tour as the
+    median and the number of moves made as the number of survivors.
+    """
+    
+    __slots__ = ('gen', 'best', 'median', 'survivors', 'elapsed')
+    
+    def __init__(self, gen, best, median, survivors, elapsed):
+        self.gen = gen
+        self.best = best
+        self.median = median
+        self.survivors = survivors
+        self.elapsed = elapsed
+        
+    def __repr__(self):
+        return "<Progress gen=%d best=%.2f median=%.2f survivors=%d elapsed=%.3f>" % (self.gen, self.best, self.median, self.survivors, self.elapsed)
+        
+# Make a Progress object from a list of tour costs and the time the search started.
+        
+def _progress(gen, costs, survivors, start):
+    costs = sorted(costs)
+    return Progress(gen, costs[0], costs[len(costs) // 2], survivors, perf_counter() - start)
+
 def select_with_probability(p):
     return random() < p
 
-def evolve(population, m, gen, maxgen, dist):
+def evolve(population, m, gen, maxgen, dist, observer = None, interval = 1, start = None):
     """
     [TSPLab] Main loop of the genetic algorithm to find the optimal tour of a set of 
     cities.  The arguments passed to evolve by esearch (the function called by the user
@@ -692,50 +2290,124 @@ def evolve(population, m, gen, maxgen, dist):
         maxgen:       stop iterating when gen reaches this number of generations
         dist:         the probability distribution for types of mutations to apply
                       (passed to rebuild_population as it creates new tours)
+        observer:     an optional function to call with a Progress object after
+                      every interval generations
+        start:        the time the search started (default: now), used to compute
+                      the elapsed time reported to the observer
     """
 #     popsize = len(population)
     best = population[0]
+    view = Canvas.view
+    start = start or perf_counter()
+    selection = dist.get('selection', 'classic')
     while gen < maxgen:
         # print("sorting...")
-        population.sort(key = Tour.cost)
-        if Canvas.view:
+        population.sort(key = Tour.cost)    # survivors are already sorted, so this merges in the new tours
+        if view:
             _update_histogram(population)
             Canvas.update()
         # print("selecting...")
-        select_survivors(population)
-        # print("compacting...")
-        ns = compact_population(population)
+        if selection == 'classic':
+            select_survivors(population)
+            # print("compacting...")
+            ns = compact_population(population)
+        else:
+            ns = select_survivors(population, selection, dist.get('tsize', 2))
         # print("rebuilding...")
         rebuild_population(population, m, ns, dist)
-        if Canvas.view and gen % Canvas.view.options['update'] == 0:
+        if view and gen % view.options['update'] == 0:
             _update_histogram(population)
             Canvas.update()
         if (population[0].cost() < best.cost()):
             best = population[0]
-            if Canvas.view:
+            if view:
                 _update_tour_display(best, gen)
                 Canvas.update()
         gen += 1
+        if observer and (gen % interval == 0 or gen == maxgen):
+            observer(_progress(gen, [t.cost() for t in population], ns, start))
     
     return best
     
-def select_survivors(population):
+_selection_methods = ('classic', 'rank', 'tournament', 'sus')
+
+def select_survivors(population, method = 'classic', tsize = 2):
     """
     [TSPLab] Apply "natural selection" to a population (an array of Tour objects).  Sort 
     the array by fitness, then remove individual i with probability i/n where n is the
     population size.  Note the first item in the array is always kept since 0/n = 0.
+    
+    The other selection methods keep the first tour plus half the population, chosen
+    all at once, and move the survivors to the front of the array (in order of cost) so 
+    there is no need to call compact_population.  They return the number of survivors.
+        rank:         choose without replacement; the chance of choosing tour i 
+                      is proportional to n - i 
+        tournament:   each survivor is the best of tsize tours chosen at random (a tour
+                      can win more than one tournament)
+        sus:          stochastic universal sampling, where the expected number of copies
+                      of each tour is proportional to 1/cost
     """
+    if method != 'classic':
+        return _select_batch(population, method, tsize)
+    
     n = len(population)
     
+    if not Canvas.view:
+        for i in range(1,n):
+            if select_with_probability(i/n):
+                population[i] = None
+        return
+    
     for i in range(1,n):
         if select_with_probability(i/n):
             population[i] = None
-            if Canvas.view and i < len(Canvas.view.histogram):  
+            if i < len(Canvas.view.histogram):  
                 Canvas.schedule(SetBarColor(i,'gray'))
+    _update_histogram(population)
+    Canvas.update()
+    
+    
+# Selection methods other than 'classic'.  The population is sorted, so choosing 
+# survivors by location also keeps them in order of cost.  Rank selection draws a
+# random key for each tour and keeps the ones with the largest keys (Efraimidis and
+# Spirakis' method for weighted sampling without replacement).  Tournament and SUS
+# selection can choose a tour more than once; the extra copies are clones, so no two
+# survivors are the same object.
+
+def _select_batch(population, method, tsize):
+    n = len(population)
+    k = n // 2
+    if n < 2 or k == 0:
+        return n
+    if method == 'rank':
+        keys = [(random() ** (1.0 / (n - i)), i) for i in range(1, n)]
+        chosen = sorted([i for (key, i) in nlargest(k, keys)])
+    elif method == 'tournament':
+        chosen = sorted([min([randint(1, n-1) for t in range(tsize)]) for s in range(k)])
+    else:
+        fitness = [1.0 / t.cost() if t.cost() > 0 else 1.0 for t in population[1:]]
+        step = fsum(fitness) / k
+        p = random() * step
+        total = 0.0
+        chosen = []
+        for (i, f) in enumerate(fitness, 1):
+            total += f
+            while p < total and len(chosen) < k:
+                chosen.append(i)
+                p += step
+    survivors = [population[0]]
+    last = 0
+    for i in chosen:
+        survivors.append(population[i].clone() if i == last else population[i])
+        last = i
+    ns = len(survivors)
+    population[:ns] = survivors
+    for i in range(ns, n):
+        population[i] = None
     if Canvas.view:
         _update_histogram(population)
         Canvas.update()
-    
+    return ns
     
 def compact_population(population):
     """
@@ -768,23 +2440,240 @@ def rebuild_population(population, m, ns, dist = {'sdmax' : 1, 'ldmax' : None, '
     
 #     prev = len(population)
 #     while len(population) < n:
-    psmall, plarge, pcross = dist['probs']
+    seen = {t.edge_hash() for t in population[:ns]} if dist.get('dedup') else None
     for i in range(ns, len(population)):
-        r = random()
-        if r < 1.0 - pcross:
-            mom = population[ randint(0, ns-1) ]
-            if r < 1.0 - (plarge + pcross):
-                d = randint(1,dist['sdmax'])
-            else:
-                d = randint(1,dist['ldmax'])
-            kid = m.make_tour( 'mutate', mom, distance = d )
-        else:
-            mom = population[ randint(0, ns-1) ]
-            dad = population[ randint(0, ns-1) ]
-            kid = m.make_tour( 'cross', mom, dad )
+        kid = _make_kid(population, m, ns, dist)
+        if seen is not None:
+            tries = 1
+            while kid.edge_hash() in seen and tries < _dedup_tries:
+                kid = _make_kid(population, m, ns, dist)
+                tries += 1
+            seen.add(kid.edge_hash())
 #         population.append(kid)
         population[i] = kid
 
+# Make a new tour from one or two random survivors (the first ns tours in the 
+# population), choosing the type of mutation according to the distribution.
+
+_dedup_tries = 3
+
+def _make_kid(population, m, ns, dist):
+    psmall, plarge, pcross = dist['probs'][:3]
+    ptwo, por = dist['probs'][3:] if len(dist['probs']) > 3 else (0.0, 0.0)
+    r = random()
+    if r < 1.0 - (pcross + ptwo + por):
+        mom = population[ randint(0, ns-1) ]
+        if r >= 1.0 - (plarge + pcross + ptwo + por):
+            kid = m.make_tour( 'mutate', mom, distance = randint(1,dist['ldmax']) )
+        elif dist.get('near'):
+            kid = m.make_tour( 'mutate', mom, near = dist['near'] )
+        else:
+            kid = m.make_tour( 'mutate', mom, distance = randint(1,dist['sdmax']) )
+    elif r < 1.0 - (ptwo + por):
+        mom = population[ randint(0, ns-1) ]
+        dad = population[ randint(0, ns-1) ]
+        kid = m.make_tour( dist.get('cross', 'cross'), mom, dad )
+    elif r < 1.0 - por:
+        mom = population[ randint(0, ns-1) ]
+        kid = m.make_tour( 'two_opt', mom )
+    else:
+        mom = population[ randint(0, ns-1) ]
+        kid = m.make_tour( 'or_opt', mom )
+    return kid
+
+# Island model
+
+_isearch_options = {
+    'islands' : 4,
+    'migrate' : 10,
+    'seed' : None,
+    'workers' : None,
+}
+
+def isearch(m, maxgen, popsize, **user_options):
+    """
+    [TSPLab] Run the evolutionary algorithm on several independent populations
+    ("islands") at the same time, using a separate process for each island.  After 
+    every few generations each island sends a copy of its best tour to the next island
+    (the last island sends to the first), where it replaces the worst tour.  The return
+    value is the lowest cost tour found on any island.
+    
+    Options for the islands and their defaults are:
+        islands :   4              number of populations
+        migrate :   10             number of generations between exchanges
+        seed :      None           if an integer, use it to seed each island so the 
+                                   search can be repeated
+        workers :   None           maximum number of processes (default: one per CPU)
+    Other options (e.g. dist and seeding) are the same as for esearch; popsize is the 
+    size of each island's population.  Islands always use the Python engine (the numpy
+    backend is not supported) and do not update the canvas.  Tour.count() is the 
+    number of tours made on all the islands.
+    """
+    options = dict(_esearch_options)
+    options.update(_isearch_options)
+    options.update(user_options)
+    if options['backend'] != 'python':
+        raise TSPError("isearch only supports the 'python' backend")
+    _check_mutation_parameters(options)
+    dist = _mutation_distribution(m, options)
+    
+    Tour.reset()                        # set tour counter to 0
+    
+    base = options['seed'] if options['seed'] is not None else getrandbits(32)
+    islands = [None] * options['islands']
+    gen = 0
+    with ProcessPoolExecutor(options['workers'], initializer = _init_island, initargs = (m,)) as pool:
+        while gen < maxgen:
+            ngen = min(options['migrate'], maxgen - gen)
+            jobs = []
+            for (i, state) in enumerate(islands):
+                key = "%d:%d:%d" % (base, i, gen)
+                jobs.append(pool.submit(_evolve_island, state, popsize, ngen, dist, key, options['seeding']))
+            islands = []
+            for job in jobs:
+                state, count = job.result()
+                islands.append(state)
+                Tour._count += count
+            _migrate(islands)
+            gen += ngen
+    
+    path, cost = min([state[0] for state in islands], key = lambda x: x[1])
+    return Tour._from_indices(m, path, cost)
+
+# Each worker process gets its own copy of the map when it starts.  The state of an
+# island is a list of (path, cost) pairs, sorted by cost; the random number generator
+# is seeded with a string derived from the island number and generation so results
+# don't depend on which process runs which island.  Each job also returns the number
+# of tours it made, which isearch adds to the tour counter.
+
+_island_map = None
+
+def _init_island(m):
+    global _island_map
+    _island_map = m
+
+def _evolve_island(state, popsize, ngen, dist, key, seeding = None):
+    seed(key)
+    Tour.reset()
+    m = _island_map
+    if state is None:
+        population = init_population(m, popsize, seeding)
+    else:
+        population = [Tour._from_indices(m, path, cost) for (path, cost) in state]
+    evolve(population, m, 0, ngen, dist)
+    population.sort(key = Tour.cost)
+    return [(t._path, t._cost) for t in population], Tour.count()
+
+def _migrate(islands):
+    best = [state[0] for state in islands]
+    for (i, state) in enumerate(islands):
+        path, cost = best[i-1]
+        state[-1] = (array('i', path), cost)
+        state.sort(key = lambda x: x[1])
+
+# Vectorized version of the genetic algorithm, used by esearch when the backend option
+# is 'numpy'.  The population is a 2-D array P with one tour (a row of city indices) 
+# per row, and C is a vector with the cost of each tour.  The population argument is a
+# list of tours to put in the first rows; the other rows start out as random tours.  Each generation follows the
+# same steps as evolve:  sort, select survivors, compact, rebuild.  The random number
+# generator is seeded from Python's random module, so random.seed also makes these
+# searches repeatable.
+
+def _np_esearch(m, population, popsize, gen, maxgen, dist, observer = None, interval = 1, start = None):
+    start = start or perf_counter()
+    rng = np.random.default_rng(getrandbits(64))
+    D = m._np_matrix()
+    popsize = max(popsize, len(population))
+    P = np.argsort(rng.random((popsize, m.size())), axis=1).astype(np.int32)
+    C = _np_pathcost(D, P)
+    if len(population) > 0:
+        P[:len(population)] = np.array([t._path for t in population], dtype=np.int32)
+        C[:len(population)] = [t.cost() for t in population]
+    
+    threshold = np.arange(len(C)) / len(C)              # probability of being removed
+    while gen < maxgen:
+        order = np.argsort(C, kind='stable')
+        P = P[order]
+        C = C[order]
+        keep = rng.random(len(C)) >= threshold
+        keep[0] = True
+        ns = int(keep.sum())
+        P[:ns] = P[keep]
+        C[:ns] = C[keep]
+        if ns < len(C):
+            _np_rebuild(P, C, D, ns, dist, rng)
+        gen += 1
+        if observer and (gen % interval == 0 or gen == maxgen):
+            observer(_progress(gen, C.tolist(), ns, start))
+    
+    order = np.argsort(C, kind='stable')
+    return [Tour._from_indices(m, array('i', P[k].tolist()), float(C[k])) for k in order]
+
+# Fill rows ns and above with mutated copies of survivors, using the same distribution
+# of mutation types as rebuild_population.
+
+def _np_rebuild(P, C, D, ns, dist, rng):
+    popsize, n = P.shape
+    k = popsize - ns
+    psmall, plarge, pcross = dist['probs']
+    r = rng.random(k)
+    moms = rng.integers(0, ns, k)
+    kids = P[moms]
+    costs = C[moms]
+    
+    rows = np.nonzero(r < 1.0 - pcross)[0]              # point mutations
+    if len(rows) > 0:
+        small = r[rows] < 1.0 - (plarge + pcross)
+        d = np.where(small, rng.integers(1, dist['sdmax'] + 1, len(rows)), rng.integers(1, dist['ldmax'] + 1, len(rows)))
+        i = rng.integers(0, n, len(rows))
+        costs[rows] += _np_swap(kids, D, rows, i, d % n)
+    
+    rows = np.nonzero(r >= 1.0 - pcross)[0]             # crossovers
+    if len(rows) > 0:
+        dads = P[rng.integers(0, ns, len(rows))]
+        i = rng.integers(0, n, len(rows))
+        size = rng.integers(2, n // 2 + 1, len(rows))
+        for (x, row) in enumerate(rows):
+            kids[row] = _np_cross(kids[row], dads[x], i[x], size[x])
+        costs[rows] = _np_pathcost(D, kids[rows])
+    
+    P[ns:] = kids
+    C[ns:] = costs
+
+# Sum the link costs of each row of P.
+
+def _np_pathcost(D, P):
+    return D[P, np.roll(P, -1, axis=1)].sum(axis=1)
+
+# Vectorized version of Tour.mutate:  in each tour in rows, exchange the city at
+# location i with the one d locations away, returning the change in cost of each tour.
+
+def _np_swap(P, D, rows, i, d):
+    n = P.shape[1]
+    j = (i + d) % n
+    pi, pj = P[rows, i], P[rows, j]
+    pxi, pyi = P[rows, (i-1) % n], P[rows, (i+1) % n]
+    pxj, pyj = P[rows, (j-1) % n], P[rows, (j+1) % n]
+    neighbors = D[pxi, pj] + D[pi, pyj] - D[pxi, pi] - D[pj, pyj]
+    distant = neighbors + D[pj, pyi] + D[pxj, pi] - D[pi, pyi] - D[pxj, pj]
+    delta = np.where(d == 1, neighbors, distant)
+    delta[d == 0] = 0.0
+    P[rows, i], P[rows, j] = pj, pi
+    return delta
+
+# Same as Tour.cross, for a pair of tours stored as rows of a population matrix.
+
+def _np_cross(mom, dad, i, size):
+    n = len(mom)
+    j = (i + size) % n
+    if i < j:
+        seg = mom[i:j]
+    else:
+        seg = np.concatenate((mom[i:], mom[:j]))
+    used = np.zeros(n, dtype=bool)
+    used[seg] = True
+    return np.concatenate((seg, dad[~used[dad]]))
+
 # Visualization
 
 _map_view_options = {
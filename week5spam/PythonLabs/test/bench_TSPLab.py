@@ -0,0 +1,190 @@
+# Benchmarks for the TSPLab search functions.
+#
+# Run from the directory above PythonLabs:
+#
+#   python -m PythonLabs.test.bench_TSPLab [--sizes 50,200,1000,5000] [--json report.json] [--csv report.csv]
+#
+# Each solver is run on the maps in the data directory (pac10, ireland, test10) and on
+# random maps of the requested sizes.  For every run the report has the wall time, the
+# number of tours created (Tour.count()), tours per second, the cost of the best tour,
+# and a convergence curve, a list of [tours created, best cost] pairs recorded while the
+# solver runs.  The evolutionary searches record the curve with an observer function;
+# random search is run in batches.  The NumPy engine keeps its population in an array, 
+# so its tour count is only the Tour objects it returns at the end of the search.  For
+# asearch and tsearch the count is the number of moves tried (maxgen * popsize for 
+# annealing, maxgen for tabu search) and the curve has [iteration, best cost] pairs.
+
+import argparse
+import csv
+import json
+import sys
+import time
+from random import seed
+
+from PythonLabs.TSPLab import *
+from PythonLabs.TSPLab import np
+
+bundled_maps = ['pac10.txt', 'ireland.txt', 'test10.txt']
+
+lazy_size = 2000            # random maps bigger than this compute distances on demand
+
+# Each solver function runs a search on map m and returns the best tour and the
+# convergence curve.  The budget for each solver is the same number of tours for
+# every map, so times for maps of different sizes can be compared.
+
+def run_rsearch(m, args):
+    best, curve, count = None, [], 0
+    batch = args.tours // args.points
+    for i in range(args.points):
+        t = rsearch(m, batch)
+        count += Tour.count()
+        if best is None or t.cost() < best.cost():
+            best = t
+        curve.append([count, best.cost()])
+    return best, curve, count
+
+def run_rsearch_numpy(m, args):
+    best, curve = None, []
+    batch = args.tours // args.points
+    for i in range(args.points):
+        t = rsearch(m, batch, backend = 'numpy', workers = args.workers)
+        if best is None or t.cost() < best.cost():
+            best = t
+        curve.append([(i+1) * batch, best.cost()])
+    return best, curve, args.points * batch
+
+def run_esearch(m, args, **options):
+    curve = []
+    step = max(1, args.maxgen // args.points)
+    observer = lambda p: curve.append([Tour.count(), p.best])
+    best = esearch(m, args.maxgen, args.popsize, observer = observer, interval = step, **options)
+    return best, curve, Tour.count()
+
+def run_esearch_numpy(m, args):
+    return run_esearch(m, args, backend = 'numpy')
+
+def run_esearch_2opt(m, args):
+    return run_esearch(m, args, dist = (0.4, 0.1, 0.2, 0.3, 0.0))
+
+def run_asearch(m, args):
+    curve = []
+    maxiter = args.maxgen * args.popsize
+    observer = lambda p: curve.append([p.gen, p.best])
+    best = asearch(m, maxiter, observer = observer, interval = max(1, maxiter // args.points))
+    return best, curve, maxiter
+
+def run_tsearch(m, args):
+    curve = []
+    observer = lambda p: curve.append([p.gen, p.best])
+    best = tsearch(m, args.maxgen, observer = observer, interval = max(1, args.maxgen // args.points))
+    return best, curve, args.maxgen
+
+def run_local_search(m, args):
+    Tour.reset()
+    t = m.make_tour('nearest')
+    curve = [[Tour.count(), t.cost()]]
+    t = local_search(t)
+    curve.append([Tour.count(), t.cost()])
+    return t, curve, Tour.count()
+
+def run_bsearch(m, args):
+    Tour.reset()
+    t = bsearch(m)
+    return t, [[Tour.count(), t.cost()]], Tour.count()
+
+# Solvers are (name, function, largest map size) triples; a solver is skipped for
+# maps with more cities.
+
+solvers = [
+    ('rsearch', run_rsearch, None),
+    ('rsearch-numpy', run_rsearch_numpy, None),
+    ('esearch', run_esearch, None),
+    ('esearch-2opt', run_esearch_2opt, None),
+    ('esearch-numpy', run_esearch_numpy, None),
+    ('asearch', run_asearch, None),
+    ('tsearch', run_tsearch, None),
+    ('local_search', run_local_search, None),
+    ('bsearch', run_bsearch, 12),
+]
+
+def benchmark_maps(args):
+    for fn in bundled_maps:
+        yield fn.split('.')[0], Map(path_to_data(fn))
+    for n in args.sizes:
+        seed(args.seed)
+        yield 'random%d' % n, Map(n, lazy = n > lazy_size)
+
+def run(args):
+    results = []
+    for name, m in benchmark_maps(args):
+        for sname, solver, nmax in solvers:
+            if args.solvers and sname not in args.solvers:  continue
+            if nmax is not None and m.size() > nmax:  continue
+            if sname.endswith('numpy') and np is None:  continue
+            seed(args.seed)
+            start = time.perf_counter()
+            tour, curve, count = solver(m, args)
+            elapsed = time.perf_counter() - start
+            results.append({
+                'map' : name,
+                'cities' : m.size(),
+                'solver' : sname,
+                'seconds' : round(elapsed, 4),
+                'tours' : count,
+                'tours_per_second' : round(count / elapsed, 1) if elapsed > 0 else None,
+                'cost' : round(tour.cost(), 2),
+                'curve' : [[c, round(x, 2)] for c, x in curve],
+            })
+            if not args.quiet:
+                print("%-12s %6d  %-14s %9.3fs %9d tours  cost %.2f" % (name, m.size(), sname, elapsed, count, tour.cost()), file = sys.stderr)
+    return results
+
+def write_csv(results, out):
+    fields = ['map', 'cities', 'solver', 'seconds', 'tours', 'tours_per_second', 'cost', 'curve']
+    writer = csv.DictWriter(out, fieldnames = fields)
+    writer.writeheader()
+    for r in results:
+        row = dict(r)
+        row['curve'] = ' '.join('%d:%s' % (c, x) for c, x in r['curve'])
+        writer.writerow(row)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the TSPLab search functions")
+    parser.add_argument('--sizes', default = '50,200,1000,5000', help = "comma separated sizes of random maps")
+    parser.add_argument('--solvers', default = '', help = "comma separated solver names (default: all)")
+    parser.add_argument('--popsize', type = int, default = 50)
+    parser.add_argument('--maxgen', type = int, default = 100)
+    parser.add_argument('--tours', type = int, default = 1000, help = "number of tours made by rsearch")
+    parser.add_argument('--points', type = int, default = 10, help = "number of points in each convergence curve")
+    parser.add_argument('--workers', type = int, default = 1, help = "number of processes for rsearch-numpy")
+    parser.add_argument('--seed', type = int, default = 1234)
+    parser.add_argument('--json', help = "write the report to this file (- for stdout)")
+    parser.add_argument('--csv', help = "write the report to this file (- for stdout)")
+    parser.add_argument('--quiet', action = 'store_true')
+    args = parser.parse_args(argv)
+    args.sizes = [int(s) for s in args.sizes.split(',') if s]
+    args.solvers = [s for s in args.solvers.split(',') if s]
+
+    results = run(args)
+    report = {
+        'python' : sys.version.split()[0],
+        'numpy' : np.__version__ if np is not None else None,
+        'settings' : {k : getattr(args, k) for k in ['popsize', 'maxgen', 'tours', 'points', 'workers', 'seed']},
+        'results' : results,
+    }
+    if args.json:
+        if args.json == '-':
+            json.dump(report, sys.stdout, indent = 1)
+        else:
+            with open(args.json, 'w') as out:
+                json.dump(report, out, indent = 1)
+    if args.csv:
+        if args.csv == '-':
+            write_csv(results, sys.stdout)
+        else:
+            with open(args.csv, 'w', newline = '') as out:
+                write_csv(results, out)
+    return report
+
+if __name__ == '__main__':
+    main()
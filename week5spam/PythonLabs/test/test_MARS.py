@@ -438,4 +438,177 @@ class MARSTest(unittest.TestCase):
         del MARS.mem_used[:]
         MARS.use_loc(4090,10)
         self.assertEqual( [(4080, 4095),(0, 13)], MARS.mem_used, "block end did not wrap around")
-  
\ No newline at end of file
+  
+    # The assembler decodes operands into integer modes and values; the string form
+    # is made only when a word is printed
+    
+    def test_17_decoded_words(self):
+        name, code, symbols, errors = MARS.assemble(["x  MOV  @x, <y", "y  DAT  #-3"])
+        self.assertEqual([], errors)
+        w = code[0]
+        self.assertEqual(Opcode.MOV, w._op)
+        self.assertEqual((Mode.INDIRECT, 0), (w._amode, w._a))
+        self.assertEqual((Mode.DECREMENT, 1), (w._bmode, w._b))
+        self.assertEqual("MOV @0 <1", str(w))
+        self.assertEqual("DAT #0 #-3", str(code[1]))
+        self.assertEqual("ADD #2 @-1", str(Word('ADD', '#2', '@-1')))
+        self.assertEqual("DAT #0 5", str(Word('DAT', '', '+5')))
+        self.assertEqual(-3, Word.field_value('@-3'))
+        with self.assertRaises(MARSError):
+            Word('MOV', 'x', '1')
+        
+        pc = PC('test', 2, 10)
+        pc.increment()
+        mem = Memory(10)
+        mem.store(5, Word('DAT', '#0', '#4'))
+        self.assertEqual(2, Word.dereference('#7', pc, mem))
+        self.assertEqual(5, Word.dereference('3', pc, mem))
+        self.assertEqual(9, Word.dereference('@3', pc, mem))
+        
+        mem = Memory(10)
+        mem.store(3, Word('DAT', '@4', '#1'))
+        mem.store_field(3, 7, 'a')
+        self.assertEqual("DAT @7 #1", str(mem.fetch(3)), "store_field should keep the addressing mode")
+
+    # Memory holds the contents of words, not Word objects:  changing a fetched word
+    # does not change memory.  Instructions still behave as they did when memory held
+    # Word objects:  CMP on two full words skips only if both operands are the same
+    # location and that location has been written, and an A operand that decrements
+    # the instruction's own B field changes the B operand.
+    
+    def test_18_memory_contents(self):
+        mem = Memory(10)
+        w = mem.fetch(4)
+        self.assertEqual("DAT #0 #0", str(w))
+        w._b = 5
+        self.assertEqual("DAT #0 #0", str(mem.fetch(4)), "fetch should return a copy")
+        mem.store(4, w)
+        self.assertEqual(Word('DAT', '#0', '#5'), mem.fetch(4))
+        mem.move(4, 7)
+        self.assertEqual(mem.fetch(4), mem.fetch(7))
+        self.assertEqual(hash(mem.fetch(4)), hash(mem.fetch(7)))
+        self.assertEqual(1, len(set([mem.fetch(4), mem.fetch(7)])), "equal words should be one set item")
+        self.assertNotEqual(mem.fetch(4), mem.fetch(5))
+        
+        m = MiniMARS(["  CMP  x, y", "  DAT  #0", "  DAT  #1", "x DAT  #3", "y DAT  #3"])
+        m.step()
+        self.assertEqual(1, m._pc.next_instr(), "CMP should not skip for two different locations")
+        m = MiniMARS(["  CMP  5, 5", "  DAT  #0"], 10)
+        m.step()
+        self.assertEqual(1, m._pc.next_instr(), "CMP should not skip for an untouched location")
+        
+        m = MiniMARS(["  DJN  <0, 2", "  DAT  #0", "  DAT  #5", "  DAT  #1"])
+        m.step()
+        self.assertEqual("DAT #0 #3", str(m._mem.fetch(1)), "B operand should use the decremented B field")
+        self.assertEqual("DAT #0 #5", str(m._mem.fetch(2)))
+
+    # Without a display MARS.run uses its own interpreter loop; the result should be
+    # the same as calling MARS.step until one program is left
+    
+    def test_19_headless_run(self):
+        def contents():
+            m = MARS.memory
+            return [list(a) for a in (m._op, m._amode, m._a, m._bmode, m._b)], [(pc._addrs[:], pc._thread) for pc in MARS.pcs]
+        def load(a, b):
+            MARS.reset()
+            MARS.load(path_to_data(a), 100)
+            MARS.load(path_to_data(b), 2100)
+        for a, b in [('mice.txt', 'chang1.txt'), ('ferret.txt', 'piper.txt'), ('dwarf.txt', 'imp.txt')]:
+            load(a, b)
+            nsteps = 3000
+            while nsteps > 0 and MARS.num_alive() >= 2:
+                MARS.step()
+                nsteps -= 1
+            expected = contents()
+            load(a, b)
+            MARS.run(3000)
+            self.assertEqual(expected, contents(), "%s vs %s" % (a, b))
+        for run in [False, True]:                 # SLT reads A before B is decremented
+            MARS.reset()
+            MARS.load(["  SLT  @2, <2", "  DAT  #0, #5", "  DAT  #0, #0"], 100)
+            MARS.load(["  MOV  0, 1"], 2100)
+            if run:
+                MARS.run(1)
+            else:
+                MARS.step()
+            self.assertEqual([102], MARS.pcs[0]._addrs, "SLT should skip")
+        MARS.reset()
+
+    # A tournament plays each pair of programs the specified number of rounds; with a
+    # seed the results are the same for any number of worker processes
+    
+    def test_20_tournament(self):
+        programs = [path_to_data(fn) for fn in ['dwarf.txt', 'imp.txt', 'mice.txt']]
+        t = Tournament(programs, rounds = 4, steps = 2000, seed = 1, workers = 1)
+        self.assertEqual(['Dwarf', 'Imp', 'Mice'], t.names())
+        results = t.run()
+        for i in range(3):
+            self.assertEqual(None, results[i][i])
+            for j in range(3):
+                if i == j:  continue
+                w, l, x = results[i][j]
+                self.assertEqual(4, w + l + x)
+                self.assertEqual([l, w, x], results[j][i])
+        self.assertEqual(3, len(t.standings()))
+        standings = t.standings()
+        self.assertEqual(results, t.run(), "a second run should not add to the first")
+        self.assertEqual(standings, t.standings())
+        t2 = Tournament(programs, rounds = 4, steps = 2000, seed = 1, workers = 2)
+        self.assertEqual(results, t2.run())
+        with self.assertRaises(MARSError):
+            Tournament(programs[:1])
+
+    # Core objects are independent MARS machines with their own size and limits; the
+    # MARS class uses a default core
+    
+    def test_21_cores(self):
+        MARS.reset()
+        c1 = Core(8000)
+        c2 = Core()
+        self.assertEqual(8000, c1.size())
+        self.assertEqual(8000, c1.memory.size())
+        self.assertEqual(4096, c2.size())
+        c1.load(path_to_data('imp.txt'), 7999)
+        self.assertEqual("MOV 0 1", str(c1.memory.fetch(7999)))
+        self.assertEqual(7999, c1.pcs[0].next_instr())
+        c1.run(10, single = True)
+        self.assertEqual("MOV 0 1", str(c1.memory.fetch(8)), "program did not wrap around")
+        self.assertEqual(0, c2.num_alive())
+        self.assertEqual(0, MARS.num_alive())
+        self.assertTrue(MARS.memory is MARS.core.memory)
+        
+        spawner = ["  SPL 0", "  JMP -1"]
+        c3 = Core(max_processes = 4, max_cycles = 50)
+        c3.load(spawner, 0)
+        c3.run(single = True)
+        self.assertEqual(4, len(c3.pcs[0]._addrs))
+        c3.reset()
+        c3.load(spawner, 0)
+        for i in range(50):
+            c3.step()
+        self.assertEqual(4, len(c3.pcs[0]._addrs))
+        
+        with self.assertRaises(MARSError):
+            Core(0)
+
+    # ADD and SUB do not reduce their results, so operand values can be arbitrarily
+    # large; a program that keeps doubling a word runs under both step and run
+    
+    def test_22_large_values(self):
+        doubler = ["loop ADD  x, x", "     JMP  loop", "x    DAT  #1, #1"]
+        results = []
+        for run in [False, True]:
+            c = Core()
+            c.load(doubler, 100)
+            c.load(["  JMP 0"], 2100)
+            if run:
+                c.run(200)
+            else:
+                for i in range(200):
+                    c.step()
+            results.append(str(c.memory.fetch(102)))
+        self.assertEqual("DAT #%d #%d" % (2**100, 2**100), results[0])
+        self.assertEqual(results[0], results[1])
+        c = Core()
+        c.load(["  DAT  #9999999999999999999999, #1"], 0)
+        self.assertEqual("DAT #9999999999999999999999 #1", str(c.memory.fetch(0)))
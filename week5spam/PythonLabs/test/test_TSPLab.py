@@ -1,4 +1,7 @@
 import unittest
+import tempfile
+import os
+import math
 
 from PythonLabs.TSPLab import *
 
@@ -184,4 +187,388 @@ class TSPTest(unittest.TestCase):
         t = rsearch(self.m, 100)
         self.assertEqual(100, Tour.count())
 
-        
\ No newline at end of file
+    # The integer-index API should agree with lookups by city name, and the
+    # matrix should be symmetric
+    
+    def test_14_map_index(self):
+        i = self.m.index('A')
+        j = self.m.index('B')
+        self.assertEqual(0, i)
+        self.assertEqual('B', self.m.label(j))
+        self.assertIsNone(self.m.index('x'))
+        self.assertAlmostEqual(self.m['A', 'B'], self.m.distance(i, j))
+        self.assertAlmostEqual(self.m.distance(j, i), self.m.distance(i, j))
+        self.assertEqual(0, self.m.distance(i, i))
+        m = Map(300)
+        self.assertEqual(300, m.size())
+        self.assertAlmostEqual(m[12, 250], m.distance(250, 12))
+
+    # Clones share the cost of the original without recomputing it, and have
+    # their own copy of the path
+    
+    def test_15_clone(self):
+        t = self.m.make_tour('random')
+        Tour.reset()
+        c = t.clone()
+        self.assertEqual(1, Tour.count())
+        self.assertEqual(t.path(), c.path())
+        self.assertEqual(t.cost(), c.cost())
+        c.mutate(i = 0)
+        self.assertNotEqual(t.path(), c.path())
+        self.assertAlmostEqual(c.cost(), c.pathcost())
+        with self.assertRaises(TSPError):
+            self.m.make_tour(['A', 'B', 'x'])
+
+    # The numpy backend should return a Tour with a valid path, and the cost
+    # updates made by the vectorized mutations should match the path costs
+    
+    @unittest.skipIf(np is None, "requires NumPy")
+    def test_16_esearch_numpy(self):
+        m = Map(30)
+        for dist in ['all_small', 'all_large', 'mixed']:
+            t = esearch(m, 20, 50, backend = 'numpy', dist = dist)
+            self.assertEqual(sorted(m.cities()), sorted(t.path()))
+            self.assertAlmostEqual(t.cost(), t.pathcost())
+        with self.assertRaises(TSPError):
+            esearch(m, 20, 50, backend = 'fortran')
+
+    # Island searches with the same seed should find the same tour, no matter
+    # how many worker processes are used
+    
+    def test_17_isearch(self):
+        m = Map(20)
+        t1 = isearch(m, 10, 20, islands = 3, migrate = 4, seed = 42)
+        n1 = Tour.count()
+        rsearch(m, 100)
+        t2 = isearch(m, 10, 20, islands = 3, migrate = 4, seed = 42, workers = 1)
+        self.assertEqual(t1.path(), t2.path())
+        self.assertEqual(n1, Tour.count(), "the tour count should include only this search")
+        self.assertTrue(n1 > 3 * 20)
+        self.assertEqual(sorted(m.cities()), sorted(t1.path()))
+        self.assertAlmostEqual(t1.cost(), t1.pathcost())
+        t3 = isearch(m, 1, 20, islands = 2, seed = 42, workers = 1, seeding = {'greedy' : 1.0})
+        self.assertTrue(t3.cost() <= m.make_tour('greedy').cost() + 1e-9, "islands should start with seeded tours")
+        with self.assertRaises(TSPError):
+            isearch(m, 10, 20, backend = 'numpy')
+
+    # 2-opt reverses the cities between two links, Or-opt moves a short segment;
+    # both update the cost incrementally.  Local search should never make a tour
+    # worse, and it should find the best tour of a map with 4 cities.
+    
+    def test_18_local_search(self):
+        m = Map(10)
+        t = m.make_tour([0,1,2,3,4,5,6,7,8,9])
+        t.two_opt(2, 6)
+        self.assertEqual((0,1,2,6,5,4,3,7,8,9), t.path())
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+        
+        t = m.make_tour([0,1,2,3,4,5,6,7,8,9])
+        t.or_opt(1, 2, 5)
+        self.assertEqual((3,4,5,1,2,6,7,8,9,0), t.path())
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+        with self.assertRaises(TSPError):
+            t.or_opt(1, 2, 0)
+        with self.assertRaises(TSPError):
+            local_search(m.make_tour([0,1,2,3,4,5]))
+        
+        m = Map(50)
+        t = m.make_tour('random')
+        tc = t.cost()
+        local_search(t)
+        self.assertLessEqual(t.cost(), tc)
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+        self.assertEqual(sorted(m.cities()), sorted(t.path()))
+        
+        for i in range(20):                     # 2-opt finds the best tour of 4 cities
+            m4 = Map(4)
+            t = local_search(m4.make_tour('random'))
+            best = min(m4.make_tour([0] + p).cost() for p in [[1,2,3], [1,3,2], [2,1,3]])
+            self.assertAlmostEqual(best, t.cost())
+        for n in [1, 2, 3]:
+            self.assertEqual(n, len(local_search(Map(n).make_tour()).path()))
+        
+        t = esearch(m, 10, 10, dist = 'all_2opt')
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+
+    # PMX keeps the segment in place and maps conflicting cities through the
+    # segment; cross-overs by both methods must produce permutations
+    
+    def test_19_pmx(self):
+        m = Map(10)
+        tfwd = m.make_tour([0,1,2,3,4,5,6,7,8,9])
+        trev = m.make_tour([9,8,7,6,5,4,3,2,1,0])
+        trot = m.make_tour([1,2,3,4,5,6,7,8,9,0])
+        
+        t = m.make_tour('pmx', tfwd, trev, i = 3, size = 4)
+        self.assertEqual((9,8,7,3,4,5,6,2,1,0), t.path())
+        
+        t = m.make_tour('pmx', tfwd, trot, i = 2, size = 3)
+        self.assertEqual((1,5,2,3,4,6,7,8,9,0), t.path())
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+        
+        for i in (0, 4):                    # a full-length segment keeps the whole tour
+            t = m.make_tour('pmx', tfwd, trev, i = i, size = 10)
+            self.assertEqual(tfwd.path(), t.path())
+            t = m.make_tour('cross', tfwd, trev, i = i, size = 10)
+            self.assertEqual(sorted(tfwd.path()), sorted(t.path()))
+        
+        for kind in ['cross', 'pmx']:
+            t = m.make_tour(kind, m.make_tour('random'), m.make_tour('random'))
+            self.assertEqual(sorted(tfwd.path()), sorted(t.path()))
+
+    # Dynamic programming and branch and bound should both find the tour found
+    # by exhaustive search
+    
+    def test_20_bsearch(self):
+        best = xsearch(self.m)
+        self.assertEqual(best.path(), bsearch(self.m).path())
+        self.assertEqual(best.path(), bsearch(self.m, dpmax = 0).path())
+        m = Map(9)
+        best = xsearch(m)
+        for dpmax in [0, 20]:
+            t = bsearch(m, dpmax = dpmax)
+            self.assertAlmostEqual(best.cost(), t.cost())
+            self.assertAlmostEqual(t.cost(), t.pathcost())
+
+    # The fast version of each_tour should generate the same tours in the same
+    # order, with costs that match the cost of a full tour, without making Tours
+    
+    def test_21_each_tour_fast(self):
+        tours = [t.path() for t in self.m.each_tour()]
+        Tour.reset()
+        n = 0
+        for (cost, path) in self.m.each_tour(fast = True):
+            t = [self.m.label(i) for i in path]
+            self.assertEqual(tours[n], tuple(t))
+            self.assertAlmostEqual(self.m.make_tour(t).cost(), cost)
+            n += 1
+        self.assertEqual(len(tours), n)
+        self.assertEqual(n, Tour.count())
+        self.assertAlmostEqual(1185.43, xsearch(self.m).cost())
+
+    # Constructed tours should visit every city once, and the grid should find
+    # the same nearest neighbors as a search of all the cities
+    
+    def test_22_construction(self):
+        m = Map(100)
+        for kind in ['nearest', 'greedy', 'christofides-lite']:
+            t = m.make_tour(kind)
+            self.assertEqual(sorted(m.cities()), sorted(t.path()))
+            self.assertAlmostEqual(t.cost(), t.pathcost())
+        self.assertEqual(42, m.make_tour('nearest', start = 42).path()[0])
+        for n in [1, 2, 3]:
+            for kind in ['nearest', 'greedy', 'christofides-lite']:
+                self.assertEqual(n, len(Map(n).make_tour(kind).path()))
+        
+        g = Grid(m._coords)
+        for i in range(m.size()):
+            a = sorted([m.distance(i, j) for j in range(m.size()) if j != i])[:3]
+            b = [m.distance(i, j) for j in g.nearest(m._coords[i], 3, skip = i)]
+            self.assertEqual(a, b)
+        
+        pop = init_population(m, 20, {'nearest' : 0.25, 'greedy' : 0.1})
+        self.assertEqual(20, len(pop))
+        with self.assertRaises(TSPError):
+            esearch(m, 1, 10, seeding = {'nearest' : 0.8, 'greedy' : 0.8})
+
+    # Neighbor lists are ordered by distance; a neighbor mutation moves one of
+    # the neighbors of city i to the next location in the tour
+    
+    def test_23_neighbors(self):
+        self.assertEqual(['D', 'E'], self.m.neighbors('A', 2))
+        with self.assertRaises(TSPError):
+            self.m.neighbors('x')
+        t = self.m.make_tour(['A', 'B', 'C', 'D', 'E', 'F', 'G'])
+        t.mutate(0, near = 1)
+        self.assertEqual(('A', 'D', 'C', 'B', 'E', 'F', 'G'), t.path())
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+        t = esearch(Map(30), 20, 10, neighbors = 4)
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+        m = Map(30)
+        t = m.make_tour('random')
+        for k in range(200):                # positions of cities must stay up to date
+            [t.mutate, t.two_opt, t.or_opt, lambda: t.mutate(near = 4)][k % 4]()
+            t = t.clone()
+            self.assertEqual([list(t._path).index(c) for c in range(30)], list(t._locations()))
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+
+
+    # A lazy map computes straight-line distances from the city coordinates instead
+    # of storing a distance matrix
+    
+    def test_24_lazy_map(self):
+        m = Map(path_to_data("test7.txt"), lazy = True)
+        self.assertTrue(m.is_lazy())
+        self.assertEqual(0, len(m._dist))
+        (xa, ya), (xb, yb) = m.coords('A'), m.coords('B')
+        self.assertAlmostEqual(((xa-xb)**2 + (ya-yb)**2) ** 0.5, m['A','B'])
+        m = Map(50, lazy = True, cache = 100)
+        self.assertAlmostEqual(m.distance(3, 7), m.distance(7, 3))
+        t = esearch(m, 10, 20)
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+        t = local_search(m.make_tour('nearest'))
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+
+    # Maps saved as text or binary files can be read back with the same cities,
+    # coordinates, and distances; a saved lazy map can be read into a regular map,
+    # and closing a map read from a binary file releases the file
+    
+    def test_25_save(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for binary in [False, True]:
+                fn = os.path.join(tmp, 'test7.map')
+                self.m.save(fn, binary = binary)
+                m = Map(fn)
+                self.assertEqual(self.m.cities(), m.cities())
+                self.assertEqual(self.m.coords('C'), m.coords('C'))
+                self.assertEqual(list(self.m._dist), list(m._dist))
+                self.assertEqual(self.m['A','G'], m['A','G'])
+                m.close()
+                lazy = Map(fn, lazy = True)
+                lazy.save(fn, binary = binary)
+                m = Map(fn)
+                self.assertFalse(m.is_lazy())
+                self.assertAlmostEqual(lazy['A','G'], m['A','G'])
+                self.assertAlmostEqual(lazy.distance(2, 5), m.distance(5, 2))
+            self.m.save(fn, binary = True)
+            with Map(fn) as m:
+                mm = m._mmap
+                self.assertEqual(self.m['A','G'], m['A','G'])
+            self.assertTrue(mm.closed)
+            os.remove(fn)
+
+    # An observer function passed to esearch is called with a Progress object every
+    # interval generations and after the last one
+    
+    def test_26_observer(self):
+        reports = []
+        t = esearch(Map(20), 25, 10, observer = reports.append, interval = 10)
+        self.assertEqual([10, 20, 25], [p.gen for p in reports])
+        for p in reports:
+            self.assertTrue(p.best <= p.median)
+            self.assertTrue(1 <= p.survivors <= 10)
+            self.assertTrue(p.elapsed >= 0)
+        self.assertAlmostEqual(t.cost(), reports[-1].best)
+
+    # A search resumed from a checkpoint file continues exactly where the saved 
+    # search left off
+    
+    def test_27_checkpoint(self):
+        m = Map(20)
+        with tempfile.TemporaryDirectory() as tmp:
+            fn = os.path.join(tmp, 'run.ckpt')
+            seed(1)
+            t1 = esearch(m, 40, 10, checkpoint = fn, checkpoint_every = 10)
+            seed(1)
+            esearch(m, 20, 10, checkpoint = fn, checkpoint_every = 10)
+            seed(2)
+            t2 = esearch(m, 40, 10, resume = fn)
+            self.assertEqual(t1.path(), t2.path())
+            with self.assertRaises(TSPError):
+                esearch(self.m, 10, 10, resume = fn)
+
+    # rsearch can return the k best tours; the numpy backend makes tours in batches
+    # and gets the same result with any number of workers
+    
+    def test_28_rsearch_top(self):
+        tours = rsearch(self.m, 100, top = 3)
+        self.assertEqual(3, len(tours))
+        self.assertTrue(tours[0].cost() <= tours[1].cost() <= tours[2].cost())
+        self.assertTrue(isinstance(rsearch(self.m, 10, top = 1), Tour))
+        for k in [0, -2, 1.5]:
+            with self.assertRaises(TSPError):
+                rsearch(self.m, 10, top = k)
+        if np is not None:
+            t1 = rsearch(self.m, 500, backend = 'numpy', batch = 64, seed = 7, top = 4)
+            t2 = rsearch(self.m, 500, backend = 'numpy', batch = 64, seed = 7, top = 4, workers = 2)
+            self.assertEqual([t.path() for t in t1], [t.path() for t in t2])
+            self.assertAlmostEqual(t1[0].cost(), t1[0].pathcost())
+            self.assertTrue(t1[0].cost() <= t1[3].cost())
+            self.assertEqual(self.m.size(), len(rsearch(self.m, 0, backend = 'numpy').path()))
+        with self.assertRaises(TSPError):
+            rsearch(self.m, 100, seed = 7)
+        with self.assertRaises(TSPError):
+            rsearch(self.m, 100, workers = 2)
+
+    # Simulated annealing and tabu search should find the optimal tour of a small map;
+    # the cost of the returned tour should be the cost of its path
+    
+    def test_29_asearch_tsearch(self):
+        best = bsearch(self.m)
+        for move in ['two_opt', 'or_opt', 'mutate']:
+            t = asearch(self.m, 2000, move = move)
+            self.assertAlmostEqual(t.cost(), t.pathcost())
+        self.assertAlmostEqual(best.cost(), asearch(self.m, 2000).cost())
+        self.assertAlmostEqual(best.cost(), tsearch(self.m, 20).cost())
+        m = Map(30)
+        reports = []
+        t = tsearch(m, 20, observer = reports.append, interval = 5)
+        self.assertEqual([5, 10, 15, 20], [p.gen for p in reports])
+        self.assertAlmostEqual(t.cost(), reports[-1].best)
+        start = m.make_tour('random')
+        t = asearch(m, 500, start = start, schedule = 'linear')
+        self.assertAlmostEqual(t.cost(), t.pathcost())
+        self.assertTrue(t.cost() <= start.cost())
+        with self.assertRaises(TSPError):
+            asearch(m, 10, move = 'cross')
+
+    # The batched selection methods keep the best tour plus half the population, in
+    # order of cost, at the front of the array; a tour chosen twice is copied
+    
+    def test_30_selection(self):
+        m = Map(20)
+        for method in ['rank', 'tournament', 'sus']:
+            pop = sorted([m.make_tour('random') for i in range(21)], key = Tour.cost)
+            best = pop[0]
+            ns = select_survivors(pop, method, tsize = 3)
+            self.assertEqual(11, ns)
+            self.assertIs(best, pop[0])
+            self.assertEqual([None] * 10, pop[ns:])
+            self.assertEqual(ns, len(set(id(t) for t in pop[:ns])), "survivors should be distinct objects")
+            costs = [t.cost() for t in pop[:ns]]
+            self.assertEqual(sorted(costs), costs)
+            t = esearch(m, 20, 10, selection = method)
+            self.assertAlmostEqual(t.cost(), t.pathcost())
+        pop = sorted([m.make_tour('random') for i in range(21)], key = Tour.cost)
+        ns = select_survivors(pop, 'tournament', tsize = 1000)
+        self.assertEqual(pop[1].path(), pop[2].path())
+        self.assertIsNot(pop[1], pop[2])
+        with self.assertRaises(TSPError):
+            esearch(m, 1, 10, selection = 'roulette')
+
+    # Tours with the same links have the same hash, no matter where they start or
+    # which direction they go; mutations update the hash incrementally
+    
+    def test_31_edge_hash(self):
+        t1 = self.m.make_tour(['A', 'B', 'C', 'D', 'E', 'F', 'G'])
+        t2 = self.m.make_tour(['D', 'C', 'B', 'A', 'G', 'F', 'E'])
+        self.assertEqual(t1.edge_hash(), t2.edge_hash())
+        t2.mutate(2)
+        self.assertNotEqual(t1.edge_hash(), t2.edge_hash())
+        t2.mutate(2)
+        self.assertEqual(t1.edge_hash(), t2.edge_hash())
+        t = Map(20).make_tour('random')
+        t.edge_hash()
+        for i in range(50):
+            t.mutate()
+            t.two_opt()
+            t.or_opt()
+        h = t.edge_hash()
+        t._hash = None
+        self.assertEqual(h, t.edge_hash())
+        pop = [Map(50).make_tour('random')] + [None] * 9
+        rebuild_population(pop, pop[0]._matrix, 1, {'sdmax' : 1, 'ldmax' : 12, 'probs' : (0,1,0), 'dedup' : True})
+        self.assertEqual(10, len({x.edge_hash() for x in pop}))
+
+    # Log estimates of the number of tours, and the solver planner, which picks an
+    # exact solver only when it should finish within the time budget
+    
+    def test_32_solver_budget(self):
+        self.assertAlmostEqual(math.log(ntours(12)), log_ntours(12))
+        self.assertAlmostEqual(math.log(factorial(30)), log_factorial(30))
+        self.assertTrue(log_ntours(10**6) > 10**6)
+        self.assertIn(solver_budget(self.m)[0], ['xsearch', 'bsearch'])
+        self.assertEqual(('esearch', 5.0), solver_budget(1000, 5.0))
+        self.assertEqual('esearch', solver_budget(15, 0.0)[0])
+        with self.assertRaises(TSPError):
+            factorial(-1)